@@ -6,6 +6,8 @@ import kotlinx.coroutines.withContext
 import org.json.JSONArray
 import org.json.JSONObject
 import java.io.*
+import java.net.HttpURLConnection
+import java.net.URL
 import java.util.concurrent.TimeUnit
 import android.util.Log
 
@@ -80,6 +82,8 @@ class MLModelManager(private val context: Context) {
     companion object {
         private const val PYTHON_SCRIPT_PATH = "/data/data/com.fasalsaathi.app/files/ml/"
         private const val MODEL_PREDICTION_TIMEOUT = 30L // seconds
+        private const val PREDICTION_SERVER_URL = "http://127.0.0.1:5000/predict"
+        private const val PREDICTION_SERVER_TIMEOUT_MS = 2000
     }
     
     /**
@@ -195,6 +199,13 @@ class MLModelManager(private val context: Context) {
             try {
                 Log.d("MLModelManager", "Executing enhanced ML prediction: $predictionType")
                 
+                // Prefer the long-lived prediction server (enhanced_ml_models.py serve),
+                // which keeps the models loaded between requests
+                requestPredictionServer(predictionType, inputJson)?.let { serverOutput ->
+                    Log.d("MLModelManager", "Prediction served by local ML server")
+                    return@withContext serverOutput
+                }
+                
                 // Try to execute the enhanced Python ML models
                 val command = when (predictionType) {
                     "crop" -> "python enhanced_ml_models.py predict_crop '$inputJson'"
@@ -232,6 +243,46 @@ class MLModelManager(private val context: Context) {
         }
     }
     
+    /**
+     * Query the local prediction server, returning null when it is not running
+     */
+    private fun requestPredictionServer(predictionType: String, inputJson: String): String? {
+        var connection: HttpURLConnection? = null
+        return try {
+            val body = JSONObject().apply {
+                put("type", predictionType)
+                put("data", JSONObject(inputJson))
+            }.toString()
+            
+            connection = URL(PREDICTION_SERVER_URL).openConnection() as HttpURLConnection
+            connection.requestMethod = "POST"
+            connection.connectTimeout = PREDICTION_SERVER_TIMEOUT_MS
+            connection.readTimeout = PREDICTION_SERVER_TIMEOUT_MS
+            connection.doOutput = true
+            connection.setRequestProperty("Content-Type", "application/json")
+            connection.outputStream.use { it.write(body.toByteArray()) }
+            
+            if (connection.responseCode != 200) {
+                return null
+            }
+            
+            val output = connection.inputStream.bufferedReader().use { it.readText() }.trim()
+            if (JSONObject(output).optBoolean("success", false)) {
+                output
+            } else {
+                // A failed prediction falls back to the Python process like an unreachable server
+                Log.d("MLModelManager", "Prediction server returned an error: $output")
+                null
+            }
+        } catch (e: Exception) {
+            Log.d("MLModelManager", "Prediction server unavailable: ${e.message}")
+            null
+        } finally {
+            // Release the socket on every path, including the fallbacks
+            connection?.disconnect()
+        }
+    }
+    
     /**
      * Enhanced simulation for testing with better accuracy
      */
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Climate Normals for Fasal Sathi
+Builds a per-grid-cell index of long-term rainfall, temperature and humidity
+from Open-Meteo archive responses, so climate features for any coordinate
+are memory-mapped array reads instead of API calls
+"""
+
+import numpy as np
+import glob
+import json
+import os
+import sys
+import warnings
+
+from model_store import save_arrays, load_arrays, read_json, STORE_META_FILE
+
+# ERA5, behind the Open-Meteo archive API, resolves 0.25°
+CLIMATE_GRID_DEGREES = 0.25
+
+DEFAULT_NORMALS_DIR = 'climate_normals'
+
+# Daily archive variables read from each location; humidity is optional
+ARCHIVE_VARIABLES = ['temperature_2m_mean', 'precipitation_sum', 'relative_humidity_2m_mean']
+
+DAYS_PER_YEAR = 365.25
+DAYS_PER_MONTH = np.array([31, 28.25, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def load_archive_files(paths):
+    """Location dicts from archive JSON files or directories of them
+
+    Each file holds one archive response (daily=ARCHIVE_VARIABLES) or a list
+    of them, as returned for multiple coordinates.
+    """
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path) as f:
+                data = json.load(f)
+            yield from (data if isinstance(data, list) else [data])
+
+def location_normals(location):
+    """Annual rainfall and monthly means of one archive response
+
+    Missing days (nulls) are skipped; annual and monthly rainfall are scaled
+    from the mean daily total, so partial years still give annual figures.
+    """
+    daily = location['daily']
+    months = np.array(daily['time'], dtype='datetime64[D]').astype('datetime64[M]').astype(int) % 12
+
+    def daily_values(variable):
+        # float conversion turns nulls into NaN
+        return np.array(daily.get(variable, []), dtype=float)
+
+    def monthly_means(values):
+        if len(values) != len(months):
+            return np.full(12, np.nan)
+        valid = ~np.isnan(values)
+        sums = np.bincount(months[valid], weights=values[valid], minlength=12)
+        counts = np.bincount(months[valid], minlength=12)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+    precipitation = daily_values('precipitation_sum')
+    monthly_rainfall = monthly_means(precipitation) * DAYS_PER_MONTH
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        annual_rainfall = np.nanmean(precipitation) * DAYS_PER_YEAR if len(precipitation) else np.nan
+    return {
+        'annual_rainfall': annual_rainfall,
+        'monthly_rainfall': monthly_rainfall,
+        'monthly_temperature': monthly_means(daily_values('temperature_2m_mean')),
+        'monthly_humidity': monthly_means(daily_values('relative_humidity_2m_mean'))
+    }
+
+def build_normals_index(locations, output_dir=DEFAULT_NORMALS_DIR, grid_degrees=CLIMATE_GRID_DEGREES):
+    """Aggregate archive locations into a dense grid index and save it
+
+    Locations falling in the same cell are averaged. The index is a model
+    store directory: a cell_index grid over the bounding box of the data
+    (-1 where there is none) pointing into per-cell rows of normals.
+    Returns the number of cells.
+    """
+    cells = {}
+    for location in locations:
+        key = (round(location['latitude'] / grid_degrees), round(location['longitude'] / grid_degrees))
+        cells.setdefault(key, []).append(location_normals(location))
+
+    if not cells:
+        raise ValueError("No archive locations to index")
+
+    keys = sorted(cells)
+    rows = np.array([key[0] for key in keys])
+    cols = np.array([key[1] for key in keys])
+    row_origin, col_origin = rows.min(), cols.min()
+
+    cell_index = np.full((rows.max() - row_origin + 1, cols.max() - col_origin + 1), -1, dtype=np.int32)
+    cell_index[rows - row_origin, cols - col_origin] = np.arange(len(keys), dtype=np.int32)
+
+    def stack(name):
+        # Mean over a cell's locations, NaN where none has the variable
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.array([np.nanmean([normals[name] for normals in cells[key]], axis=0) for key in keys],
+                            dtype=np.float32)
+
+    arrays = {'cell_index': cell_index}
+    arrays.update((name, stack(name)) for name in
+                  ['annual_rainfall', 'monthly_rainfall', 'monthly_temperature', 'monthly_humidity'])
+
+    save_arrays(arrays, output_dir, meta={
+        'grid_degrees': grid_degrees,
+        'row_origin': int(row_origin),
+        'col_origin': int(col_origin),
+        'cells': len(keys)
+    })
+    return len(keys)
+
+class ClimateNormals:
+    """Memory-mapped climate normals index
+
+    A lookup is two index computations and a few array reads; only the
+    pages touched are read from disk, and processes on one host share them.
+    """
+
+    def __init__(self, normals_dir=DEFAULT_NORMALS_DIR, mmap_mode='r'):
+        meta = read_json(os.path.join(normals_dir, STORE_META_FILE))['meta']
+        self.grid_degrees = meta['grid_degrees']
+        self.row_origin = meta['row_origin']
+        self.col_origin = meta['col_origin']
+
+        arrays = load_arrays(normals_dir, mmap_mode)
+        self.cell_index = arrays['cell_index']
+        self.annual_rainfall = arrays['annual_rainfall']
+        self.monthly_rainfall = arrays['monthly_rainfall']
+        self.monthly_temperature = arrays['monthly_temperature']
+        self.monthly_humidity = arrays['monthly_humidity']
+
+    def cell(self, latitude, longitude):
+        """Row of a coordinate's cell in the normals arrays, or None without data"""
+        row = round(latitude / self.grid_degrees) - self.row_origin
+        col = round(longitude / self.grid_degrees) - self.col_origin
+        if not (0 <= row < self.cell_index.shape[0] and 0 <= col < self.cell_index.shape[1]):
+            return None
+        cell = int(self.cell_index[row, col])
+        return cell if cell >= 0 else None
+
+    def annual_rainfall_at(self, latitude, longitude):
+        """Long-term annual rainfall in mm, or None without data"""
+        cell = self.cell(latitude, longitude)
+        if cell is None or np.isnan(self.annual_rainfall[cell]):
+            return None
+        return float(self.annual_rainfall[cell])
+
+    def lookup(self, latitude, longitude, month=None):
+        """Normals of a coordinate's cell, or None without data
+
+        With a month (1-12) the monthly values are narrowed to that month.
+        NaN (no data for the variable) is reported as None.
+        """
+        cell = self.cell(latitude, longitude)
+        if cell is None:
+            return None
+
+        def value(values):
+            values = np.asarray(values, dtype=float)
+            if values.ndim == 0:
+                return None if np.isnan(values) else round(float(values), 1)
+            return [None if np.isnan(v) else round(float(v), 1) for v in values]
+
+        def monthly(array):
+            return value(array[cell] if month is None else array[cell, month - 1])
+
+        return {
+            "annual_rainfall": value(self.annual_rainfall[cell]),
+            "rainfall": monthly(self.monthly_rainfall),
+            "temperature": monthly(self.monthly_temperature),
+            "humidity": monthly(self.monthly_humidity)
+        }
+
+if __name__ == "__main__":
+    # build <archive.json|dir> [...] [--output DIR] [--grid DEG]
+    if len(sys.argv) >= 3 and sys.argv[1] == "build":
+        args = sys.argv[2:]
+        output_dir = DEFAULT_NORMALS_DIR
+        grid_degrees = CLIMATE_GRID_DEGREES
+        paths = []
+        i = 0
+        while i < len(args):
+            if args[i] == '--output' and i + 1 < len(args):
+                output_dir = args[i + 1]
+                i += 2
+            elif args[i] == '--grid' and i + 1 < len(args):
+                grid_degrees = float(args[i + 1])
+                i += 2
+            else:
+                paths.append(args[i])
+                i += 1
+
+        cells = build_normals_index(load_archive_files(paths), output_dir, grid_degrees)
+        print(json.dumps({"cells": cells, "output": output_dir}))
+        sys.exit(0)
+
+    # lookup <latitude> <longitude> [month]
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "lookup":
+        normals = ClimateNormals()
+        month = int(sys.argv[4]) if len(sys.argv) == 5 else None
+        print(json.dumps(normals.lookup(float(sys.argv[2]), float(sys.argv[3]), month), indent=2))
+        sys.exit(0)
+
+    print("Usage: python climate_normals.py build <archive.json|dir> [...] [--output DIR] [--grid DEG]")
+    print("       python climate_normals.py lookup <latitude> <longitude> [month]")
+    sys.exit(1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Compact Model Format for Fasal Sathi
+Flattens trained gradient boosting models, scaler and label encoders into
+plain NumPy arrays and evaluates them without scikit-learn
+"""
+
+import numpy as np
+
+# Child index sklearn uses to mark a leaf node
+TREE_LEAF = -1
+
+class CompactGradientBoosting:
+    """Pure-NumPy evaluator for a flattened GradientBoostingClassifier
+
+    All trees are stored back to back in flat node arrays; tree t starts at
+    roots[t] and trees are ordered stage by stage, one per class within a stage.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, init_raw,
+                 learning_rate, n_classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.init_raw = init_raw
+        self.learning_rate = float(learning_rate)
+        self.n_classes = int(n_classes)
+        self.max_depth = int(max_depth)
+
+        # Binary models have a single tree per stage
+        self.trees_per_stage = 1 if self.n_classes <= 2 else self.n_classes
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted GradientBoostingClassifier"""
+        if model.loss not in ('log_loss', 'deviance'):
+            raise ValueError(f"Unsupported loss for compact export: {model.loss}")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for stage in model.estimators_:
+            for estimator in stage:
+                tree = estimator.tree_
+                roots.append(offset)
+
+                # Child indices become global so every tree shares one node array
+                is_leaf = tree.children_left == TREE_LEAF
+                lefts.append(np.where(is_leaf, TREE_LEAF, tree.children_left + offset))
+                rights.append(np.where(is_leaf, TREE_LEAF, tree.children_right + offset))
+                features.append(np.where(is_leaf, 0, tree.feature))
+                thresholds.append(tree.threshold)
+                values.append(tree.value[:, 0, 0])
+
+                offset += tree.node_count
+                max_depth = max(max_depth, tree.max_depth)
+
+        # The default init estimator predicts a constant prior, so one row is enough
+        n_features = model.n_features_in_
+        init_raw = model._raw_predict_init(np.zeros((1, n_features)))[0]
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            init_raw=np.asarray(init_raw, dtype=np.float64),
+            learning_rate=model.learning_rate,
+            n_classes=len(model.classes_),
+            max_depth=max_depth
+        )
+
+    def decision_function(self, X):
+        """Raw scores, one column per tree of a stage"""
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+
+        # NaN would fail every split test and silently go right; reject it as sklearn does
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN, infinity or a value too large for float32")
+        n_samples = len(X)
+        rows = np.arange(n_samples)[:, None]
+
+        # Walk every sample down every tree at once, one level per step
+        nodes = np.tile(self.roots, (n_samples, 1))
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            is_split = left != TREE_LEAF
+            if not is_split.any():
+                break
+
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(is_split, np.where(go_left, left, self.right[nodes]), nodes)
+
+        # Accumulate stage by stage in the same order as sklearn's predict_stages
+        leaf_values = self.value[nodes].reshape(n_samples, -1, self.trees_per_stage)
+        raw = np.tile(self.init_raw, (n_samples, 1))
+        for stage in range(leaf_values.shape[1]):
+            raw += self.learning_rate * leaf_values[:, stage]
+
+        return raw
+
+    def predict_proba(self, X):
+        raw = self.decision_function(X)
+
+        if self.trees_per_stage == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+
+        exp = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return np.argmax(self.predict_proba(X), axis=1)
+
+    def to_arrays(self, prefix):
+        return {
+            f'{prefix}_feature': self.feature,
+            f'{prefix}_threshold': self.threshold,
+            f'{prefix}_left': self.left,
+            f'{prefix}_right': self.right,
+            f'{prefix}_value': self.value,
+            f'{prefix}_roots': self.roots,
+            f'{prefix}_init_raw': self.init_raw,
+            f'{prefix}_params': np.array([self.learning_rate, self.n_classes, self.max_depth], dtype=np.float64)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        learning_rate, n_classes, max_depth = arrays[f'{prefix}_params']
+        return cls(
+            feature=arrays[f'{prefix}_feature'],
+            threshold=arrays[f'{prefix}_threshold'],
+            left=arrays[f'{prefix}_left'],
+            right=arrays[f'{prefix}_right'],
+            value=arrays[f'{prefix}_value'],
+            roots=arrays[f'{prefix}_roots'],
+            init_raw=arrays[f'{prefix}_init_raw'],
+            learning_rate=learning_rate,
+            n_classes=n_classes,
+            max_depth=max_depth
+        )
+
+class CompactScaler:
+    """StandardScaler.transform from the fitted mean and scale arrays"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+class CompactEncoder:
+    """LabelEncoder stand-in holding only the class names"""
+
+    def __init__(self, classes):
+        self.classes_ = classes
+
+    def inverse_transform(self, indices):
+        return self.classes_[np.asarray(indices)]
+
+def export_compact_models(crop_model, soil_model, scaler, crop_encoder, soil_encoder):
+    """Flatten the enhanced model set into a dict of plain arrays"""
+    arrays = {}
+    arrays.update(CompactGradientBoosting.from_sklearn(crop_model).to_arrays('crop'))
+    arrays.update(CompactGradientBoosting.from_sklearn(soil_model).to_arrays('soil'))
+
+    arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    # Fixed-width unicode instead of object arrays, so no pickling is needed to load
+    arrays['crop_classes'] = np.asarray(crop_encoder.classes_).astype(str)
+    arrays['soil_classes'] = np.asarray(soil_encoder.classes_).astype(str)
+
+    return arrays
+
+def load_compact_models(arrays):
+    """Rebuild (crop_model, soil_model, scaler, crop_encoder, soil_encoder) from arrays"""
+    return (
+        CompactGradientBoosting.from_arrays(arrays, 'crop'),
+        CompactGradientBoosting.from_arrays(arrays, 'soil'),
+        CompactScaler(arrays['scaler_mean'], arrays['scaler_scale']),
+        CompactEncoder(arrays['crop_classes']),
+        CompactEncoder(arrays['soil_classes'])
+    )
+
+def save_compact_file(arrays, path):
+    """Write the arrays uncompressed into a single .npz file"""
+    np.savez(path, **arrays)
+
+def load_compact_file(path):
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
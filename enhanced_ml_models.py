@@ -4,25 +4,164 @@ Enhanced ML Models for Fasal Sathi
 Advanced crop recommendation and soil analysis with improved accuracy
 """
 
-import pandas as pd
+import time
+
+# Taken before any other import so --timings can report import cost
+STARTUP_TIME = time.perf_counter()
+
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import accuracy_score, classification_report
 import joblib
 import json
 import sys
 import os
+import copy
+import hashlib
+import threading
+import multiprocessing
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from compact_models import export_compact_models, load_compact_models, save_compact_file, load_compact_file
+from model_store import (save_arrays, load_arrays, process_memory, STORE_META_FILE, create_version_dir,
+                         write_manifest, publish_version, read_current_version, prune_versions,
+                         DEFAULT_KEEP_VERSIONS)
+from inference_core import FeatureLayout, ScaledModelBackend, InferenceCore, benchmark_core
+
+# pandas and the sklearn training modules are imported inside the methods that
+# need them, so the predict commands only pay for what inference loads
+
+IMPORTS_DONE_TIME = time.perf_counter()
+
+# Defaults match the deployment block in ml_pipeline/android_integration/model_config.json
+DEFAULT_SERVER_HOST = '127.0.0.1'
+DEFAULT_SERVER_PORT = 5000
+PREDICT_ENDPOINT = '/predict'
+
+# Pickled sklearn artifacts by model attribute, and the array-only export that
+# loads without sklearn. The export is a model store directory of .npy files
+# (memory-mapped on load); a path ending in .npz gives a single-file copy instead.
+# Both live in the published version directory, or flat in models_dir for
+# model sets saved before versioning.
+MODEL_ARTIFACTS = {
+    'crop_model': 'enhanced_crop_model.pkl',
+    'soil_model': 'enhanced_soil_model.pkl',
+    'scaler': 'enhanced_scaler.pkl',
+    'crop_encoder': 'enhanced_crop_encoder.pkl',
+    'soil_encoder': 'enhanced_soil_encoder.pkl'
+}
+COMPACT_MODEL_DIR = 'enhanced_compact'
+
+# Model input features in training order, and the soil data keys they are read from
+FEATURE_COLUMNS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 'ec', 'oc']
+FEATURE_KEYS = ['n', 'p', 'k', 'temperature', 'humidity', 'ph', 'rainfall', 'ec', 'oc']
+FEATURE_DEFAULTS = {'ec': 1.0, 'oc': 0.8}
+
+# Soil health card column names (lowercased) that differ from the soil data keys
+CSV_COLUMN_MAP = {
+    'n_kg_per_ha': 'n', 'p_kg_per_ha': 'p', 'k_kg_per_ha': 'k',
+    'ec_ds_per_m': 'ec', 'oc_percent': 'oc'
+}
+CSV_ID_COLUMNS = ['farmer_id', 'id']
+
+class PredictionCache:
+    """Bounded LRU cache of prediction results with an optional TTL
+    
+    Keys are the model input rounded to `precision` decimals plus the model
+    version, so near-identical readings share an entry and entries from older
+    artifacts never match.
+    """
+    
+    def __init__(self, max_size=1024, ttl=None, precision=2):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.precision = precision
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def make_key(self, kind, features, model_version):
+        return (kind, model_version, tuple(np.round(features, self.precision).tolist()))
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            result, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self.entries.move_to_end(key)
+            self.hits += 1
+        
+        # Callers get their own copy so they cannot mutate the cached result
+        return copy.deepcopy(result)
+    
+    def put(self, key, result):
+        entry = (copy.deepcopy(result), time.monotonic())
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
 
 class EnhancedMLModel:
-    def __init__(self):
+    def __init__(self, models_dir='ml_models', cache_size=0, cache_ttl=None, cache_precision=2,
+                 keep_versions=DEFAULT_KEEP_VERSIONS):
+        self.models_dir = models_dir
+        self.keep_versions = keep_versions
+        self.model_version = None
+        self.artifact_dir = None
+        self.compact_path = None
+        
+        # Held only while the model attributes are read or replaced, so a
+        # prediction never mixes the scaler of one version with another's model
+        self.swap_lock = threading.Lock()
+        self.reload_stats = {"reloads": 0}
+        
+        # Optional LRU cache in front of predict_crop / predict_soil_type
+        self.prediction_cache = PredictionCache(cache_size, cache_ttl, cache_precision) if cache_size > 0 else None
+        
         self.crop_model = None
         self.soil_model = None
-        self.scaler = StandardScaler()
-        self.crop_encoder = LabelEncoder()
-        self.soil_encoder = LabelEncoder()
+        self.scaler = None
+        self.crop_encoder = None
+        self.soil_encoder = None
+        
+        # Inference cores over the installed model set, rebuilt on every swap
+        self.feature_layout = FeatureLayout(FEATURE_KEYS, FEATURE_DEFAULTS)
+        self.crop_core = None
+        self.soil_core = None
         
         # Enhanced crop database with regional variations
         self.crop_database = {
@@ -141,83 +280,111 @@ class EnhancedMLModel:
                 'ph_range': (5.5, 7.5), 'organic_matter': 'medium'
             }
         }
+        
+        self.compile_crop_database()
     
-    def generate_enhanced_dataset(self, n_samples=10000):
-        """Generate enhanced synthetic dataset for training"""
-        np.random.seed(42)
+    def compile_crop_database(self):
+        """Precompile optimal ranges into crops x parameters min/max matrices
         
-        data = []
+        Call again after editing crop_database so suitability scoring sees the change.
+        """
+        self.suitability_crops = list(self.crop_database.keys())
+        self.suitability_index = {crop: i for i, crop in enumerate(self.suitability_crops)}
         
-        for _ in range(n_samples):
-            # Randomly select a crop and generate data around its optimal conditions
-            crop = np.random.choice(list(self.crop_database.keys()))
-            crop_info = self.crop_database[crop]
-            conditions = crop_info['optimal_conditions']
-            
-            # Add realistic variations around optimal conditions
-            temperature = np.random.normal(
-                (conditions['temperature'][0] + conditions['temperature'][1]) / 2, 3)
-            humidity = np.random.normal(
-                (conditions['humidity'][0] + conditions['humidity'][1]) / 2, 5)
-            rainfall = np.random.normal(
-                (conditions['rainfall'][0] + conditions['rainfall'][1]) / 2, 100)
-            
-            ph = np.random.normal(
-                (conditions['ph'][0] + conditions['ph'][1]) / 2, 0.3)
-            n = np.random.normal(
-                (conditions['n'][0] + conditions['n'][1]) / 2, 15)
-            p = np.random.normal(
-                (conditions['p'][0] + conditions['p'][1]) / 2, 8)
-            k = np.random.normal(
-                (conditions['k'][0] + conditions['k'][1]) / 2, 12)
-            
-            # Add some noise for more realistic data
-            temperature += np.random.normal(0, 2)
-            humidity = max(10, min(100, humidity + np.random.normal(0, 3)))
-            rainfall = max(0, rainfall + np.random.normal(0, 50))
-            ph = max(3, min(10, ph + np.random.normal(0, 0.2)))
-            
-            # Generate corresponding soil type based on crop preferences
-            suitable_soils = crop_info['soil_types']
-            soil_type = np.random.choice(suitable_soils)
-            
-            # Add electrical conductivity and organic carbon
-            ec = np.random.uniform(0.5, 2.5)
-            oc = np.random.uniform(0.3, 1.5)
-            
-            data.append([
-                n, p, k, temperature, humidity, ph, rainfall, ec, oc, crop, soil_type
-            ])
+        self.suitability_params = []
+        for crop_info in self.crop_database.values():
+            for param in crop_info['optimal_conditions']:
+                if param not in self.suitability_params:
+                    self.suitability_params.append(param)
+        
+        # NaN marks a parameter without an optimal range for that crop
+        ranges = np.full((len(self.suitability_crops), len(self.suitability_params), 2), np.nan)
+        for i, crop in enumerate(self.suitability_crops):
+            for j, param in enumerate(self.suitability_params):
+                if param in self.crop_database[crop]['optimal_conditions']:
+                    ranges[i, j] = self.crop_database[crop]['optimal_conditions'][param]
+        
+        self.suitability_min = ranges[:, :, 0]
+        self.suitability_max = ranges[:, :, 1]
+        
+        # Where each suitability parameter sits in the model feature matrix
+        self.suitability_columns = [FEATURE_KEYS.index(param) if param in FEATURE_KEYS else None
+                                    for param in self.suitability_params]
+    
+    def generate_enhanced_dataset(self, n_samples=10000, seed=42):
+        """Generate enhanced synthetic dataset for training
+        
+        Every column is drawn as one array from a seeded np.random.Generator,
+        so generating millions of rows takes seconds.
+        """
+        rng = np.random.default_rng(seed)
+        crops = list(self.crop_database.keys())
+        soils = list(self.soil_characteristics.keys())
+        
+        # Midpoint of each crop's optimal range (crops x parameters) and the
+        # spread of the realistic variations around it
+        params = ['temperature', 'humidity', 'rainfall', 'ph', 'n', 'p', 'k']
+        midpoints = np.array([
+            [sum(self.crop_database[crop]['optimal_conditions'][param]) / 2 for param in params]
+            for crop in crops
+        ])
+        spread = np.array([3, 5, 100, 0.3, 15, 8, 12])
+        
+        # Randomly select a crop per sample and generate data around its optimal conditions
+        crop_index = rng.integers(len(crops), size=n_samples)
+        temperature, humidity, rainfall, ph, n, p, k = rng.normal(midpoints[crop_index], spread).T
+        
+        # Add some noise for more realistic data
+        temperature = temperature + rng.normal(0, 2, n_samples)
+        humidity = np.clip(humidity + rng.normal(0, 3, n_samples), 10, 100)
+        rainfall = np.maximum(0, rainfall + rng.normal(0, 50, n_samples))
+        ph = np.clip(ph + rng.normal(0, 0.2, n_samples), 3, 10)
+        
+        # Generate corresponding soil type based on crop preferences
+        soil_options = [self.crop_database[crop]['soil_types'] for crop in crops]
+        widest = max(len(options) for options in soil_options)
+        soil_table = np.array([options + options[:1] * (widest - len(options)) for options in soil_options])
+        soil_counts = np.array([len(options) for options in soil_options])
+        soil_type = soil_table[crop_index, rng.integers(soil_counts[crop_index])]
+        
+        # Add electrical conductivity and organic carbon
+        ec = rng.uniform(0.5, 2.5, n_samples)
+        oc = rng.uniform(0.3, 1.5, n_samples)
         
         # Add some random samples for edge cases
-        for _ in range(n_samples // 5):
-            data.append([
-                np.random.uniform(20, 300),    # N
-                np.random.uniform(5, 100),     # P
-                np.random.uniform(20, 300),    # K
-                np.random.uniform(5, 45),      # Temperature
-                np.random.uniform(20, 95),     # Humidity
-                np.random.uniform(3.5, 9.5),   # pH
-                np.random.uniform(100, 3000),   # Rainfall
-                np.random.uniform(0.1, 3.0),   # EC
-                np.random.uniform(0.1, 2.0),   # OC
-                np.random.choice(list(self.crop_database.keys())),
-                np.random.choice(list(self.soil_characteristics.keys()))
-            ])
-        
-        columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 
-                  'ec', 'oc', 'label', 'soil_type']
-        
-        return pd.DataFrame(data, columns=columns)
+        n_edge = n_samples // 5
+        columns = {
+            'N': (n, rng.uniform(20, 300, n_edge)),
+            'P': (p, rng.uniform(5, 100, n_edge)),
+            'K': (k, rng.uniform(20, 300, n_edge)),
+            'temperature': (temperature, rng.uniform(5, 45, n_edge)),
+            'humidity': (humidity, rng.uniform(20, 95, n_edge)),
+            'ph': (ph, rng.uniform(3.5, 9.5, n_edge)),
+            'rainfall': (rainfall, rng.uniform(100, 3000, n_edge)),
+            'ec': (ec, rng.uniform(0.1, 3.0, n_edge)),
+            'oc': (oc, rng.uniform(0.1, 2.0, n_edge)),
+            'label': (np.array(crops)[crop_index], rng.choice(crops, n_edge)),
+            'soil_type': (soil_type, rng.choice(soils, n_edge))
+        }
+        
+        import pandas as pd
+        return pd.DataFrame({name: np.concatenate(parts) for name, parts in columns.items()})
     
     def train_models(self):
         """Train enhanced crop and soil prediction models"""
+        from sklearn.ensemble import GradientBoostingClassifier
+        from sklearn.model_selection import train_test_split, cross_val_score
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+        
+        self.scaler = StandardScaler()
+        self.crop_encoder = LabelEncoder()
+        self.soil_encoder = LabelEncoder()
+        
         print("🤖 Generating enhanced training dataset...")
         df = self.generate_enhanced_dataset(15000)
         
         # Prepare features
-        feature_columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 'ec', 'oc']
-        X = df[feature_columns]
+        X = df[FEATURE_COLUMNS]
         
         # Scale features
         X_scaled = self.scaler.fit_transform(X)
@@ -277,81 +444,296 @@ class EnhancedMLModel:
         return crop_accuracy, soil_accuracy
     
     def save_models(self):
-        """Save trained models and preprocessors"""
-        models_dir = 'ml_models'
-        os.makedirs(models_dir, exist_ok=True)
+        """Save trained models and preprocessors as a new published version
         
-        joblib.dump(self.crop_model, f'{models_dir}/enhanced_crop_model.pkl')
-        joblib.dump(self.soil_model, f'{models_dir}/enhanced_soil_model.pkl')
-        joblib.dump(self.scaler, f'{models_dir}/enhanced_scaler.pkl')
-        joblib.dump(self.crop_encoder, f'{models_dir}/enhanced_crop_encoder.pkl')
-        joblib.dump(self.soil_encoder, f'{models_dir}/enhanced_soil_encoder.pkl')
+        Files are written to versions/<timestamp>/ with a manifest, and
+        current.json is switched only once they are complete, so running
+        predictors never read a half-written model set. Versions beyond the
+        newest keep_versions are then deleted (None keeps them all).
+        """
+        os.makedirs(self.models_dir, exist_ok=True)
+        version, version_dir = create_version_dir(self.models_dir)
+        
+        for name, filename in MODEL_ARTIFACTS.items():
+            joblib.dump(getattr(self, name), f'{version_dir}/{filename}')
         
         # Save crop database
-        with open(f'{models_dir}/crop_database.json', 'w') as f:
+        with open(f'{version_dir}/crop_database.json', 'w') as f:
             json.dump(self.crop_database, f, indent=2)
         
-        print(f"💾 Enhanced models saved to {models_dir}/")
+        write_manifest(version_dir, version)
+        publish_version(self.models_dir, version)
+        if self.keep_versions is not None:
+            prune_versions(self.models_dir, self.keep_versions)
+        
+        self.install_models(self.snapshot_models(), version, version_dir)
+        print(f"💾 Enhanced models saved to {version_dir}/")
+    
+    def resolve_artifact_dir(self):
+        """(version, directory) of the published model set, falling back to the
+        flat files in models_dir when nothing has been published"""
+        version, version_dir = read_current_version(self.models_dir)
+        return version, version_dir or self.models_dir
+    
+    def read_pickled_models(self, artifact_dir, mmap_mode=None):
+        return {
+            name: joblib.load(f'{artifact_dir}/{filename}', mmap_mode=mmap_mode)
+            for name, filename in MODEL_ARTIFACTS.items()
+        }
     
-    def load_models(self):
-        """Load pre-trained models"""
-        models_dir = 'ml_models'
+    def load_models(self, mmap_mode=None):
+        """Load pre-trained models
+        
+        With mmap_mode='r' numpy arrays stored in the (uncompressed) artifacts
+        are memory-mapped, so processes loading the same files share pages.
+        """
+        version, artifact_dir = self.resolve_artifact_dir()
         
         try:
-            self.crop_model = joblib.load(f'{models_dir}/enhanced_crop_model.pkl')
-            self.soil_model = joblib.load(f'{models_dir}/enhanced_soil_model.pkl')
-            self.scaler = joblib.load(f'{models_dir}/enhanced_scaler.pkl')
-            self.crop_encoder = joblib.load(f'{models_dir}/enhanced_crop_encoder.pkl')
-            self.soil_encoder = joblib.load(f'{models_dir}/enhanced_soil_encoder.pkl')
-            
-            return True
+            models = self.read_pickled_models(artifact_dir, mmap_mode)
         except FileNotFoundError:
             print("⚠️ Model files not found. Training new models...")
             return False
+        
+        if version is None:
+            version = self.file_signature([f'{artifact_dir}/{filename}' for filename in MODEL_ARTIFACTS.values()])
+        self.install_models(models, version, artifact_dir)
+        return True
     
-    def predict_crop(self, soil_data):
-        """Enhanced crop prediction with confidence scores"""
+    def export_compact_models(self, output_path=None, n_check=2000):
+        """Flatten the loaded sklearn models into plain arrays
+        
+        The export is reloaded and checked against sklearn's predict_proba on
+        generated samples; returns the output path and the largest difference.
+        """
+        output_path = output_path or f'{self.artifact_dir}/{COMPACT_MODEL_DIR}'
+        arrays = export_compact_models(self.crop_model, self.soil_model, self.scaler,
+                                       self.crop_encoder, self.soil_encoder)
+        if output_path.endswith('.npz'):
+            save_compact_file(arrays, output_path)
+        else:
+            save_arrays(arrays, output_path, meta={
+                'source_version': self.model_version,
+                'exported_at': datetime.now().isoformat()
+            })
+        
+        crop_model, soil_model, scaler, _, _ = load_compact_models(self.read_compact_arrays(output_path))
+        check = self.generate_enhanced_dataset(n_check, seed=7)[FEATURE_COLUMNS]
+        max_diff = max(
+            np.abs(crop_model.predict_proba(scaler.transform(check)) -
+                   self.crop_model.predict_proba(self.scaler.transform(check))).max(),
+            np.abs(soil_model.predict_proba(scaler.transform(check)) -
+                   self.soil_model.predict_proba(self.scaler.transform(check))).max()
+        )
+        return output_path, float(max_diff)
+    
+    def read_compact_arrays(self, path, mmap_mode='r'):
+        if path.endswith('.npz'):
+            return load_compact_file(path)
+        return load_arrays(path, mmap_mode=mmap_mode)
+    
+    def read_compact_models(self, path, mmap_mode='r'):
+        return dict(zip(MODEL_ARTIFACTS, load_compact_models(self.read_compact_arrays(path, mmap_mode))))
+    
+    def load_compact(self, path=None, mmap_mode='r'):
+        """Load the array-only export written by export_compact_models
+        
+        Store arrays are memory-mapped by default, so every worker on the host
+        shares one copy of the trees and a reload only remaps the files.
+        """
+        version, artifact_dir = self.resolve_artifact_dir()
+        if path is None:
+            path = f'{artifact_dir}/{COMPACT_MODEL_DIR}'
+        else:
+            version = None
+        
         try:
-            # Prepare input data
-            features = np.array([[
-                soil_data['n'], soil_data['p'], soil_data['k'],
-                soil_data['temperature'], soil_data['humidity'], soil_data['ph'],
-                soil_data['rainfall'], soil_data.get('ec', 1.0), soil_data.get('oc', 0.8)
-            ]])
-            
-            # Scale features
-            features_scaled = self.scaler.transform(features)
-            
-            # Get prediction probabilities
-            probabilities = self.crop_model.predict_proba(features_scaled)[0]
-            
-            # Get crop names
-            crop_names = self.crop_encoder.classes_
-            
-            # Sort by confidence
-            crop_confidence_pairs = list(zip(crop_names, probabilities))
-            crop_confidence_pairs.sort(key=lambda x: x[1], reverse=True)
-            
-            # Get top recommendation
-            top_crop = crop_confidence_pairs[0][0]
-            top_confidence = crop_confidence_pairs[0][1]
-            
-            # Get all recommendations with confidence > 0.1
-            all_recommendations = [
-                {"crop": crop, "confidence": float(conf)}
-                for crop, conf in crop_confidence_pairs if conf > 0.05
-            ]
-            
-            # Add suitability analysis
-            suitability_analysis = self.analyze_crop_suitability(soil_data, top_crop)
+            models = self.read_compact_models(path, mmap_mode)
+        except FileNotFoundError:
+            print("⚠️ Compact model files not found. Run the export command first.")
+            return False
+        
+        if version is None:
+            version = self.file_signature([path if path.endswith('.npz') else f'{path}/{STORE_META_FILE}'])
+        self.install_models(models, version, artifact_dir, compact_path=path)
+        return True
+    
+    def file_signature(self, paths):
+        """Model version for unversioned artifacts, from file mtimes and sizes"""
+        signature = hashlib.sha1()
+        for path in paths:
+            stat = os.stat(path)
+            signature.update(f'{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+        return signature.hexdigest()[:12]
+    
+    def install_models(self, models, version, artifact_dir, compact_path=None):
+        """Swap in a complete model set, dropping cached predictions when the
+        version changes"""
+        with self.swap_lock:
+            for name, model in models.items():
+                setattr(self, name, model)
+            self.crop_core = InferenceCore(self.feature_layout, ScaledModelBackend(self.crop_model, self.scaler),
+                                           self.crop_encoder.classes_)
+            self.soil_core = InferenceCore(self.feature_layout, ScaledModelBackend(self.soil_model, self.scaler),
+                                           self.soil_encoder.classes_)
+            self.artifact_dir = artifact_dir
+            self.compact_path = compact_path
             
-            return {
+            if version != self.model_version and self.prediction_cache is not None:
+                self.prediction_cache.clear()
+            self.model_version = version
+    
+    def snapshot_models(self):
+        """The current model set, read under the swap lock so it is never half
+        replaced; predictions read crop_core / soil_core instead"""
+        with self.swap_lock:
+            return {name: getattr(self, name) for name in MODEL_ARTIFACTS}
+    
+    def reload_if_changed(self):
+        """Load the published model set if current.json names a new version
+        
+        The new set is fully loaded before the swap and in-flight predictions
+        keep the snapshot they started with, so no request is dropped; the old
+        set is freed once the last of them finishes. Returns True on a swap.
+        """
+        version, artifact_dir = read_current_version(self.models_dir)
+        if version is None or version == self.model_version:
+            return False
+        
+        started = time.perf_counter()
+        memory_before = process_memory()
+        
+        # Stay on the same format; a compact server waits for the new version's export
+        compact_path = f'{artifact_dir}/{COMPACT_MODEL_DIR}' if self.compact_path is not None else None
+        try:
+            if compact_path:
+                models = self.read_compact_models(compact_path)
+            else:
+                models = self.read_pickled_models(artifact_dir)
+        except FileNotFoundError as e:
+            self.reload_stats["last_error"] = str(e)
+            return False
+        
+        # Both model sets are resident here, which is the reload's peak memory
+        memory_overlap = process_memory()
+        self.install_models(models, version, artifact_dir, compact_path)
+        del models
+        
+        self.reload_stats.update({
+            "reloads": self.reload_stats["reloads"] + 1,
+            "last_reload_ms": round((time.perf_counter() - started) * 1000, 2),
+            "rss_before_kb": memory_before.get('rss_kb'),
+            "rss_overlap_kb": memory_overlap.get('rss_kb'),
+            "rss_after_kb": process_memory().get('rss_kb'),
+            "last_error": None
+        })
+        return True
+    
+    def watch_models(self, interval=2.0):
+        """Poll current.json from a daemon thread and hot-swap new versions"""
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"🔄 Loaded model version {self.model_version} "
+                              f"in {self.reload_stats['last_reload_ms']} ms")
+                except Exception as e:
+                    self.reload_stats["last_error"] = str(e)
+                    print(f"⚠️ Model reload failed: {e}")
+        
+        thread = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        thread.start()
+        return thread
+    
+    def prepare_feature_matrix(self, samples):
+        """Build the N x 9 model input from soil dicts, an array or a DataFrame
+        
+        Soil dicts are written into a reused per-thread buffer, so the matrix
+        is only valid until the next call on the same thread.
+        """
+        return self.feature_layout.matrix(samples)
+    
+    def predict_crop_batch(self, samples, top_k=5):
+        """Crop prediction for many samples with one vectorized model call
+        
+        Accepts a list of soil dicts, an N x 9 array in FEATURE_KEYS order or a
+        DataFrame, and returns one predict_crop-shaped result per row. Errors are
+        raised rather than folded into fallback results.
+        """
+        # One attribute read, so a concurrent swap cannot mix model versions
+        core = self.crop_core
+        features, probabilities, top_indices = core.predict(samples, top_k)
+        
+        # Suitability analysis of every row against its top crop
+        top_crops = [core.class_names[idx] for idx in top_indices[:, 0]]
+        suitability_analyses = self.batch_suitability(features, top_crops)
+        
+        # Keep recommendations with confidence > 0.05
+        recommendations = core.top_classes(probabilities, top_indices, min_confidence=0.05)
+        
+        return [
+            {
                 "success": True,
                 "recommended_crop": top_crop,
-                "confidence": float(top_confidence),
-                "top_recommendations": all_recommendations[:5],
+                "confidence": float(probs[indices[0]]),
+                "top_recommendations": [{"crop": crop, "confidence": prob} for crop, prob in top],
                 "suitability_analysis": suitability_analysis
             }
+            for top_crop, probs, indices, top, suitability_analysis in zip(
+                top_crops, probabilities, top_indices, recommendations, suitability_analyses)
+        ]
+    
+    def predict_soil_batch(self, samples, top_k=3):
+        """Soil type prediction for many samples with one vectorized model call
+        
+        Takes the same inputs as predict_crop_batch and returns one
+        predict_soil_type-shaped result per row.
+        """
+        core = self.soil_core
+        _, probabilities, top_indices = core.predict(samples, top_k)
+        
+        # Keep predictions with confidence > 0.05
+        predictions = core.top_classes(probabilities, top_indices, min_confidence=0.05)
+        
+        return [
+            {
+                "success": True,
+                "soil_type": core.class_names[indices[0]],
+                "confidence": float(probs[indices[0]]),
+                "top_predictions": [{"soil_type": soil, "confidence": prob} for soil, prob in top]
+            }
+            for probs, indices, top in zip(probabilities, top_indices, predictions)
+        ]
+    
+    def benchmark_inference(self, calls=2000):
+        """Per-call latency of the pre-core predict path against the inference core"""
+        return {
+            "crop": benchmark_core(self.crop_core, self.crop_encoder, calls=calls),
+            "soil": benchmark_core(self.soil_core, self.soil_encoder, calls=calls)
+        }
+    
+    def cached_prediction(self, kind, soil_data, predict_batch):
+        """Run a single-sample batch prediction through the prediction cache"""
+        if self.prediction_cache is None:
+            return predict_batch([soil_data])[0]
+        
+        features = self.prepare_feature_matrix([soil_data])[0]
+        key = self.prediction_cache.make_key(kind, features, self.model_version)
+        result = self.prediction_cache.get(key)
+        if result is None:
+            result = predict_batch([soil_data])[0]
+            self.prediction_cache.put(key, result)
+        return result
+    
+    def cache_stats(self):
+        """Hit/miss/eviction counters of the prediction cache, None when disabled"""
+        return self.prediction_cache.stats() if self.prediction_cache is not None else None
+    
+    def predict_crop(self, soil_data):
+        """Enhanced crop prediction with confidence scores"""
+        try:
+            return self.cached_prediction('crop', soil_data, self.predict_crop_batch)
             
         except Exception as e:
             return {
@@ -365,42 +747,7 @@ class EnhancedMLModel:
     def predict_soil_type(self, soil_data):
         """Enhanced soil type prediction"""
         try:
-            # Prepare input data
-            features = np.array([[
-                soil_data['n'], soil_data['p'], soil_data['k'],
-                soil_data['temperature'], soil_data['humidity'], soil_data['ph'],
-                soil_data['rainfall'], soil_data.get('ec', 1.0), soil_data.get('oc', 0.8)
-            ]])
-            
-            # Scale features
-            features_scaled = self.scaler.transform(features)
-            
-            # Get prediction probabilities
-            probabilities = self.soil_model.predict_proba(features_scaled)[0]
-            
-            # Get soil type names
-            soil_names = self.soil_encoder.classes_
-            
-            # Sort by confidence
-            soil_confidence_pairs = list(zip(soil_names, probabilities))
-            soil_confidence_pairs.sort(key=lambda x: x[1], reverse=True)
-            
-            # Get top prediction
-            top_soil = soil_confidence_pairs[0][0]
-            top_confidence = soil_confidence_pairs[0][1]
-            
-            # Get all predictions with confidence > 0.1
-            all_predictions = [
-                {"soil_type": soil, "confidence": float(conf)}
-                for soil, conf in soil_confidence_pairs if conf > 0.05
-            ]
-            
-            return {
-                "success": True,
-                "soil_type": top_soil,
-                "confidence": float(top_confidence),
-                "top_predictions": all_predictions[:3]
-            }
+            return self.cached_prediction('soil', soil_data, self.predict_soil_batch)
             
         except Exception as e:
             return {
@@ -411,38 +758,190 @@ class EnhancedMLModel:
                 "top_predictions": []
             }
     
-    def analyze_crop_suitability(self, soil_data, crop):
-        """Analyze suitability of crop for given conditions"""
-        if crop not in self.crop_database:
-            return {"suitability_score": 0.5, "recommendations": ["Crop data not available"]}
+    def score_frame(self, frame):
+        """Score a DataFrame of soil data, returning (crop_results, soil_results)
+        
+        Rows with missing feature values get failed results instead of failing
+        the whole frame.
+        """
+        features = self.prepare_feature_matrix(frame)
+        valid = ~np.isnan(features).any(axis=1)
+        
+        crop_results = [None] * len(features)
+        soil_results = [None] * len(features)
+        
+        if valid.any():
+            valid_rows = features[valid]
+            for i, crop, soil in zip(np.flatnonzero(valid),
+                                     self.predict_crop_batch(valid_rows),
+                                     self.predict_soil_batch(valid_rows)):
+                crop_results[i] = crop
+                soil_results[i] = soil
+        
+        for i in np.flatnonzero(~valid):
+            crop_results[i] = {"success": False, "error": "Missing feature values"}
+            soil_results[i] = {"success": False, "error": "Missing feature values"}
+        
+        return crop_results, soil_results
+    
+    def score_csv(self, input_path, output_path, chunksize=10000, defaults=None, workers=1):
+        """Stream a soil health card CSV through the models chunk by chunk
+        
+        Columns are mapped to model features (N_kg_per_ha -> n, pH -> ph, ...);
+        features missing from the file are taken from defaults. Results are
+        appended to output_path after every chunk, as JSON lines when it ends
+        in .jsonl and as CSV otherwise. With workers > 1 chunks are scored in a
+        process pool and written back in input order. Returns the number of
+        rows scored.
+        """
+        as_jsonl = str(output_path).endswith('.jsonl')
+        rows_scored = 0
+        
+        with open(output_path, 'w', newline='') as out:
+            chunks = self.iter_feature_chunks(input_path, chunksize, defaults)
+            for chunk_number, (ids, (crop_results, soil_results)) in enumerate(self.score_chunks(chunks, workers)):
+                self.write_scored_chunk(out, ids, crop_results, soil_results, as_jsonl, chunk_number == 0)
+                
+                rows_scored += len(ids)
+                print(f"  ✅ Scored {rows_scored} rows", file=sys.stderr)
+        
+        return rows_scored
+    
+    def iter_feature_chunks(self, input_path, chunksize, defaults=None):
+        """Yield (ids, frame) chunks of a CSV with columns renamed to FEATURE_KEYS"""
+        import pandas as pd
+        
+        defaults = dict(defaults or {})
+        
+        # Resolve which file columns feed which feature from the header only
+        header = pd.read_csv(input_path, nrows=0).columns
+        rename = {}
+        for column in header:
+            key = CSV_COLUMN_MAP.get(column.lower(), column.lower())
+            if key in FEATURE_KEYS and key not in rename.values():
+                rename[column] = key
+        
+        id_column = next((col for col in header if col.lower() in CSV_ID_COLUMNS), None)
+        missing = [key for key in FEATURE_KEYS
+                   if key not in rename.values() and key not in defaults and key not in FEATURE_DEFAULTS]
+        if missing:
+            raise ValueError(f"Missing feature column(s) {missing}; supply them as defaults")
         
-        crop_info = self.crop_database[crop]
-        conditions = crop_info['optimal_conditions']
+        usecols = list(rename) + ([id_column] if id_column and id_column not in rename else [])
+        rows_read = 0
+        
+        for chunk in pd.read_csv(input_path, usecols=usecols, chunksize=chunksize):
+            ids = chunk[id_column].tolist() if id_column else list(range(rows_read, rows_read + len(chunk)))
+            chunk = chunk.rename(columns=rename)[[key for key in FEATURE_KEYS if key in rename.values()]]
+            for key, value in defaults.items():
+                if key not in chunk.columns:
+                    chunk[key] = value
+            
+            rows_read += len(chunk)
+            yield ids, chunk
+    
+    def score_chunks(self, chunks, workers=1):
+        """Score (ids, frame) chunks, yielding (ids, results) in input order
+        
+        With workers > 1 each worker process loads the models once with
+        memory-mapped arrays, from the compact store when this model was loaded
+        from one; at most two chunks per worker are in flight so
+        the input is still streamed rather than read ahead.
+        """
+        if workers <= 1:
+            for ids, chunk in chunks:
+                yield ids, self.score_frame(chunk)
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring_worker,
+                                 initargs=(self.artifact_dir, self.compact_path)) as executor:
+            pending = deque()
+            for ids, chunk in chunks:
+                pending.append((ids, executor.submit(score_chunk_in_worker, chunk)))
+                if len(pending) >= workers * 2:
+                    ids, future = pending.popleft()
+                    yield ids, future.result()
+            
+            while pending:
+                ids, future = pending.popleft()
+                yield ids, future.result()
+    
+    def write_scored_chunk(self, out, ids, crop_results, soil_results, as_jsonl, write_header):
+        """Append one chunk of scoring results to an open CSV or JSONL file"""
+        if as_jsonl:
+            for row_id, crop, soil in zip(ids, crop_results, soil_results):
+                out.write(json.dumps({"id": row_id, "crop": crop, "soil": soil}) + '\n')
+            return
+        
+        import pandas as pd
+        rows = pd.DataFrame({
+            "id": list(ids),
+            "success": [crop["success"] and soil["success"] for crop, soil in zip(crop_results, soil_results)],
+            "recommended_crop": [crop.get("recommended_crop") for crop in crop_results],
+            "crop_confidence": [crop.get("confidence") for crop in crop_results],
+            "suitability_score": [crop.get("suitability_analysis", {}).get("suitability_score") for crop in crop_results],
+            "soil_type": [soil.get("soil_type") for soil in soil_results],
+            "soil_confidence": [soil.get("confidence") for soil in soil_results]
+        })
+        rows.to_csv(out, header=write_header, index=False)
+    
+    def suitability_values(self, features):
+        """Pick the suitability parameters out of an N x 9 feature matrix"""
+        values = np.full((len(features), len(self.suitability_params)), np.nan)
+        for j, column in enumerate(self.suitability_columns):
+            if column is not None:
+                values[:, j] = features[:, column]
+        return values
+    
+    def suitability_matrix(self, values, crop_indices=None):
+        """Score parameter values against the compiled optimal ranges
+        
+        values is N x parameters (NaN for unknown values). Without crop_indices
+        every row is scored against every crop, giving N x crops x parameters
+        parameter scores and N x crops overall scores; with one crop index per
+        row the crop axis is dropped. Parameters without a value or range are
+        NaN and left out of the overall score, which is 0.5 when none remain.
+        """
+        if crop_indices is None:
+            values = values[:, None, :]
+            lower, upper = self.suitability_min[None], self.suitability_max[None]
+        else:
+            lower, upper = self.suitability_min[crop_indices], self.suitability_max[crop_indices]
+        
+        # Relative distance outside the optimal range, 0 inside it
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deviation = np.where(values < lower, (lower - values) / lower,
+                                 np.where(values > upper, (values - upper) / upper, 0.0))
+        
+        parameter_scores = np.maximum(0.0, 1.0 - deviation)
+        known = ~(np.isnan(values) | np.isnan(lower))
+        parameter_scores = np.where(known, parameter_scores, np.nan)
+        
+        counts = known.sum(axis=-1)
+        totals = np.where(known, parameter_scores, 0.0).sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(counts > 0, totals / counts, 0.5)
+        
+        return parameter_scores, scores
+    
+    def suitability_report(self, crop, values, parameter_scores, suitability_score):
+        """Build the suitability analysis dict for one sample and crop"""
+        conditions = self.crop_database[crop]['optimal_conditions']
         
         suitability_factors = {}
         recommendations = []
         
-        # Analyze each parameter
-        for param, optimal_range in conditions.items():
-            if param in soil_data:
-                value = soil_data[param]
-                min_val, max_val = optimal_range
-                
-                if min_val <= value <= max_val:
-                    suitability_factors[param] = 1.0
-                else:
-                    # Calculate how far outside the range
-                    if value < min_val:
-                        deviation = (min_val - value) / min_val
-                        recommendations.append(f"Increase {param}: current {value:.1f}, optimal {min_val}-{max_val}")
-                    else:
-                        deviation = (value - max_val) / max_val
-                        recommendations.append(f"Reduce {param}: current {value:.1f}, optimal {min_val}-{max_val}")
-                    
-                    suitability_factors[param] = max(0.0, 1.0 - deviation)
-        
-        # Calculate overall suitability score
-        suitability_score = np.mean(list(suitability_factors.values())) if suitability_factors else 0.5
+        # Explain each parameter that is outside its optimal range
+        for param, value, param_score in zip(self.suitability_params, values, parameter_scores):
+            if np.isnan(param_score):
+                continue
+            
+            suitability_factors[param] = float(param_score)
+            min_val, max_val = conditions[param]
+            if value < min_val:
+                recommendations.append(f"Increase {param}: current {value:.1f}, optimal {min_val}-{max_val}")
+            elif value > max_val:
+                recommendations.append(f"Reduce {param}: current {value:.1f}, optimal {min_val}-{max_val}")
         
         # Add management recommendations
         if suitability_score > 0.8:
@@ -459,20 +958,349 @@ class EnhancedMLModel:
             "parameter_scores": suitability_factors,
             "recommendations": recommendations
         }
+    
+    def analyze_crop_suitability(self, soil_data, crop):
+        """Analyze suitability of crop for given conditions"""
+        if crop not in self.suitability_index:
+            return {"suitability_score": 0.5, "recommendations": ["Crop data not available"]}
+        
+        values = np.array([[soil_data.get(param, np.nan) for param in self.suitability_params]], dtype=float)
+        parameter_scores, scores = self.suitability_matrix(values, np.array([self.suitability_index[crop]]))
+        
+        return self.suitability_report(crop, values[0], parameter_scores[0], scores[0])
+    
+    def batch_suitability(self, features, crops):
+        """Suitability analysis of each feature row for its given crop
+        
+        Scores are computed for all rows at once; recommendation strings are
+        only built for the returned rows.
+        """
+        known = np.array([crop in self.suitability_index for crop in crops], dtype=bool)
+        analyses = [{"suitability_score": 0.5, "recommendations": ["Crop data not available"]}] * len(crops)
+        
+        if known.any():
+            values = self.suitability_values(features[known])
+            crop_indices = np.array([self.suitability_index[crop] for crop in np.asarray(crops)[known]])
+            parameter_scores, scores = self.suitability_matrix(values, crop_indices)
+            
+            for row, i in enumerate(np.flatnonzero(known)):
+                analyses[i] = self.suitability_report(crops[i], values[row], parameter_scores[row], scores[row])
+        
+        return analyses
+    
+    def rank_crops_by_suitability(self, samples, top_k=None):
+        """Rank every crop in crop_database by agronomic suitability for each sample
+        
+        Takes the same inputs as predict_crop_batch and returns, per sample, a
+        list of {"crop", "suitability_score"} sorted best first.
+        """
+        features = self.prepare_feature_matrix(samples)
+        _, scores = self.suitability_matrix(self.suitability_values(features))
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        
+        return [
+            [{"crop": self.suitability_crops[idx], "suitability_score": float(row_scores[idx])} for idx in row_order]
+            for row_scores, row_order in zip(scores, order)
+        ]
+
+# Model loaded once per process by init_scoring_worker for parallel scoring
+worker_model = None
+
+def init_scoring_worker(models_dir, compact_path=None):
+    """Process pool initializer: load the models once for this worker
+    
+    models_dir is the parent's resolved artifact directory, so every worker
+    scores with the same model version as the parent.
+    """
+    global worker_model
+    worker_model = EnhancedMLModel(models_dir)
+    if compact_path:
+        worker_model.load_compact(compact_path)
+    else:
+        worker_model.load_models(mmap_mode='r')
+
+def score_chunk_in_worker(chunk):
+    """Score one DataFrame chunk with the worker's models"""
+    return worker_model.score_frame(chunk)
+
+# Ways of loading the models compared by the memory_report command
+MEMORY_MODES = ['pickle', 'pickle_mmap', 'compact_heap', 'compact']
+
+# Seconds a memory_report worker may take to load, predict and report
+WORKER_MEMORY_TIMEOUT = 300
+
+def memory_mode_missing(models_dir, mode):
+    """Why a memory mode cannot run against the published models, or None if it can"""
+    _, artifact_dir = EnhancedMLModel(models_dir).resolve_artifact_dir()
+    if mode.startswith('pickle'):
+        missing = [filename for filename in MODEL_ARTIFACTS.values()
+                   if not os.path.exists(f'{artifact_dir}/{filename}')]
+        return f"Missing model files in {artifact_dir}: {', '.join(missing)}" if missing else None
+    
+    if not os.path.exists(f'{artifact_dir}/{COMPACT_MODEL_DIR}/{STORE_META_FILE}'):
+        return f"No compact export in {artifact_dir}; run the export command first"
+    return None
+
+def report_worker_memory(models_dir, mode, barrier, results):
+    """Load the models one way and report memory once every worker has loaded
+    
+    Exactly one result is put per worker: memory numbers, or an error. A
+    failing worker breaks the barrier so the others stop waiting for it.
+    """
+    memory = None
+    try:
+        ml_model = EnhancedMLModel(models_dir)
+        if mode == 'pickle':
+            loaded = ml_model.load_models()
+        elif mode == 'pickle_mmap':
+            loaded = ml_model.load_models(mmap_mode='r')
+        elif mode == 'compact_heap':
+            loaded = ml_model.load_compact(mmap_mode=None)
+        else:
+            loaded = ml_model.load_compact()
+        if not loaded:
+            raise FileNotFoundError(f"Could not load the {mode} models from {models_dir}")
+        
+        # Predict once so the trees are actually paged in
+        rng = np.random.default_rng(0)
+        samples = ml_model.scaler.mean_ + ml_model.scaler.scale_ * rng.standard_normal((500, len(FEATURE_COLUMNS)))
+        ml_model.predict_crop_batch(samples)
+        ml_model.predict_soil_batch(samples)
+        
+        # Measure while all workers are alive, so shared pages are split between them
+        barrier.wait(WORKER_MEMORY_TIMEOUT)
+        memory = process_memory()
+    except Exception as e:
+        barrier.abort()
+        memory = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        results.put(memory if memory is not None else {"error": "Worker exited before measuring"})
+    
+    # Stay alive until every worker has measured
+    try:
+        barrier.wait(WORKER_MEMORY_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+
+def measure_worker_memory(models_dir, mode, workers):
+    """Average RSS per worker and total PSS for N workers loading the same models
+    
+    Modes whose artifacts do not exist are skipped without starting workers;
+    a worker that fails or does not report in time gives an error result.
+    """
+    missing = memory_mode_missing(models_dir, mode)
+    if missing:
+        return {"mode": mode, "workers": workers, "skipped": missing}
+    
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    
+    processes = [context.Process(target=report_worker_memory, args=(models_dir, mode, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    
+    memories = []
+    errors = []
+    for _ in processes:
+        try:
+            memories.append(results.get(timeout=WORKER_MEMORY_TIMEOUT))
+        except queue.Empty:
+            errors.append(f"A worker did not report within {WORKER_MEMORY_TIMEOUT}s")
+            break
+    
+    for process in processes:
+        process.join(WORKER_MEMORY_TIMEOUT if not errors else 0)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        if process.exitcode:
+            errors.append(f"Worker exited with code {process.exitcode}")
+    
+    errors = [memory['error'] for memory in memories if 'error' in memory] + errors
+    if errors:
+        return {"mode": mode, "workers": workers, "error": errors[0]}
+    
+    rss = [memory['rss_kb'] for memory in memories if 'rss_kb' in memory]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "rss_kb_per_worker": int(np.mean(rss)) if rss else None,
+        "pss_kb_total": sum(memory.get('pss_kb', 0) for memory in memories)
+    }
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler answering prediction requests from an already loaded model"""
+    
+    ml_model = None
+    
+    def do_GET(self):
+        if self.path.split('?')[0] == '/health':
+            self.send_json(200, {
+                "status": "ok",
+                "model_version": self.ml_model.model_version,
+                "cache": self.ml_model.cache_stats(),
+                "reload": self.ml_model.reload_stats
+            })
+        else:
+            self.send_json(404, {"success": False, "error": f"Unknown endpoint: {self.path}"})
+    
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"success": False, "error": f"Invalid JSON body: {e}"})
+            return
+        
+        # /predict takes {"type": "crop" | "soil", "data": {...} | [...]}, the typed
+        # endpoints take the soil data directly like the CLI commands do
+        if path == PREDICT_ENDPOINT:
+            if not isinstance(payload, dict):
+                self.send_json(400, {"success": False, "error": "JSON body must be an object"})
+                return
+            prediction_type = payload.get('type', 'crop')
+            soil_data = payload.get('data', {})
+        elif path in ('/predict_crop', '/predict_soil'):
+            prediction_type = path[len('/predict_'):]
+            soil_data = payload
+        else:
+            self.send_json(404, {"success": False, "error": f"Unknown endpoint: {path}"})
+            return
+        
+        if prediction_type not in ('crop', 'soil'):
+            self.send_json(400, {"success": False, "error": f"Unknown prediction type: {prediction_type}"})
+            return
+        
+        # A list of samples is scored in one batch call
+        if isinstance(soil_data, list):
+            try:
+                if prediction_type == 'crop':
+                    results = self.ml_model.predict_crop_batch(soil_data)
+                else:
+                    results = self.ml_model.predict_soil_batch(soil_data)
+                result = {"success": True, "results": results}
+            except Exception as e:
+                result = {"success": False, "error": str(e), "results": []}
+        elif prediction_type == 'crop':
+            result = self.ml_model.predict_crop(soil_data)
+        else:
+            result = self.ml_model.predict_soil_type(soil_data)
+        
+        self.send_json(200, result)
+    
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        # Per-request access logs to stderr cost more than the prediction itself
+        pass
+
+def serve(ml_model, host=DEFAULT_SERVER_HOST, port=DEFAULT_SERVER_PORT):
+    """Serve predictions over HTTP, keeping the loaded models in memory"""
+    handler = type('BoundPredictionRequestHandler', (PredictionRequestHandler,), {'ml_model': ml_model})
+    server = ThreadingHTTPServer((host, port), handler)
+    
+    print(f"🚀 Prediction server listening on http://{host}:{port}{PREDICT_ENDPOINT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Prediction server stopped")
+    finally:
+        server.server_close()
+
+class StartupTimer:
+    """Collects per-phase wall times of a CLI run for the --timings report"""
+    
+    def __init__(self):
+        self.phases = {"imports_ms": (IMPORTS_DONE_TIME - STARTUP_TIME) * 1000}
+        self.last = IMPORTS_DONE_TIME
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[f"{phase}_ms"] = (now - self.last) * 1000
+        self.last = now
+    
+    def report(self):
+        # Interpreter start-up happens before STARTUP_TIME and is not included
+        self.phases["total_ms"] = (time.perf_counter() - STARTUP_TIME) * 1000
+        timings = {phase: round(ms, 2) for phase, ms in self.phases.items()}
+        print(json.dumps({"timings": timings}), file=sys.stderr)
+
+def load_serving_models(ml_model, compact=False):
+    """Load the models a command predicts with, training them if none exist
+    
+    With compact a missing export exits instead: training writes no compact
+    export, so a retrain would only fall back to sklearn after minutes.
+    """
+    if compact:
+        if not ml_model.load_compact():
+            sys.exit(1)
+    elif not ml_model.load_models():
+        ml_model.train_models()
+
+def parse_options(args):
+    """Split CLI arguments into positionals and --name value options"""
+    positionals, options = [], {}
+    i = 0
+    while i < len(args):
+        if args[i].startswith('--'):
+            options[args[i][2:]] = args[i + 1] if i + 1 < len(args) else ''
+            i += 2
+        else:
+            positionals.append(args[i])
+            i += 1
+    return positionals, options
 
 def main():
+    # --timings reports import / load / predict wall times on stderr
+    timer = None
+    if '--timings' in sys.argv:
+        sys.argv.remove('--timings')
+        timer = StartupTimer()
+    
+    # --compact serves from the exported arrays, so inference never imports sklearn
+    compact = '--compact' in sys.argv
+    if compact:
+        sys.argv.remove('--compact')
+    
     if len(sys.argv) < 2:
         print("Usage: python enhanced_ml_models.py <command> [args...]")
         print("Commands:")
-        print("  train                    - Train new enhanced models")
+        print("  train [--keep-versions N]")
+        print(f"                           - Train new enhanced models, keeping the newest N versions "
+              f"(default {DEFAULT_KEEP_VERSIONS})")
         print("  predict_crop <json>      - Predict crop for soil data")
         print("  predict_soil <json>      - Predict soil type for data")
+        print("                             (add --timings to report start-up cost on stderr)")
+        print("  export [output]          - Flatten trained models into a compact array store")
+        print("                             (add --compact to predict/serve/score_csv to load it instead)")
+        print("  serve [port] [host] [--cache-size N] [--cache-ttl S] [--cache-precision D] [--watch S]")
+        print("                           - Keep models loaded and serve predictions over HTTP")
+        print("  score_csv <input> <output> [--chunksize N] [--defaults <json>] [--workers N]")
+        print("                           - Stream a soil health card CSV to CSV/JSONL results")
+        print("  memory_report [--workers N]")
+        print("                           - Compare worker memory for pickled vs memory-mapped models")
+        print("  benchmark_core [--calls N]")
+        print("                           - Per-call latency of the pre-core predict path vs the inference core")
         sys.exit(1)
     
     command = sys.argv[1]
     ml_model = EnhancedMLModel()
     
     if command == "train":
+        args, options = parse_options(sys.argv[2:])
+        if 'keep-versions' in options:
+            ml_model.keep_versions = int(options['keep-versions'])
+        
         print("🚀 Training Enhanced ML Models for Fasal Sathi...")
         crop_acc, soil_acc = ml_model.train_models()
         print(f"\n✅ Training Complete!")
@@ -484,13 +1312,18 @@ def main():
             sys.exit(1)
         
         # Load models
-        if not ml_model.load_models():
-            ml_model.train_models()
+        load_serving_models(ml_model, compact)
+        if timer:
+            timer.mark('load_models')
         
         # Parse input
         soil_data = json.loads(sys.argv[2])
         result = ml_model.predict_crop(soil_data)
+        if timer:
+            timer.mark('predict')
         print(json.dumps(result, indent=2))
+        if timer:
+            timer.report()
         
     elif command == "predict_soil":
         if len(sys.argv) < 3:
@@ -498,13 +1331,85 @@ def main():
             sys.exit(1)
         
         # Load models
-        if not ml_model.load_models():
-            ml_model.train_models()
+        load_serving_models(ml_model, compact)
+        if timer:
+            timer.mark('load_models')
         
         # Parse input
         soil_data = json.loads(sys.argv[2])
         result = ml_model.predict_soil_type(soil_data)
+        if timer:
+            timer.mark('predict')
         print(json.dumps(result, indent=2))
+        if timer:
+            timer.report()
+        
+    elif command == "export":
+        if not ml_model.load_models():
+            ml_model.train_models()
+        
+        output_path = sys.argv[2] if len(sys.argv) > 2 else None
+        output_path, max_diff = ml_model.export_compact_models(output_path)
+        if os.path.isdir(output_path):
+            size_bytes = sum(os.path.getsize(os.path.join(output_path, name)) for name in os.listdir(output_path))
+        else:
+            size_bytes = os.path.getsize(output_path)
+        size_kb = size_bytes / 1024
+        print(f"💾 Compact models saved to {output_path} ({size_kb:.0f} KB)")
+        print(f"📊 Max predict_proba difference vs sklearn: {max_diff:.2e}")
+        
+    elif command == "serve":
+        args, options = parse_options(sys.argv[2:])
+        port = int(args[0]) if len(args) > 0 else DEFAULT_SERVER_PORT
+        host = args[1] if len(args) > 1 else DEFAULT_SERVER_HOST
+        
+        ml_model = EnhancedMLModel(
+            cache_size=int(options.get('cache-size', 0)),
+            cache_ttl=float(options['cache-ttl']) if 'cache-ttl' in options else None,
+            cache_precision=int(options.get('cache-precision', 2))
+        )
+        
+        # Load models once for the lifetime of the server
+        load_serving_models(ml_model, compact)
+        
+        # --watch S swaps in newly published model versions without a restart
+        if 'watch' in options:
+            ml_model.watch_models(float(options['watch']))
+        
+        serve(ml_model, host, port)
+        
+    elif command == "score_csv":
+        args, options = parse_options(sys.argv[2:])
+        if len(args) < 2:
+            print("Error: Missing input or output path")
+            sys.exit(1)
+        
+        # Load models
+        load_serving_models(ml_model, compact)
+        
+        chunksize = int(options.get('chunksize', 10000))
+        defaults = json.loads(options['defaults']) if 'defaults' in options else None
+        workers = int(options.get('workers', 1))
+        try:
+            rows = ml_model.score_csv(args[0], args[1], chunksize=chunksize, defaults=defaults, workers=workers)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"💾 Scored {rows} rows to {args[1]}")
+        
+    elif command == "memory_report":
+        args, options = parse_options(sys.argv[2:])
+        workers = int(options.get('workers', 4))
+        
+        for mode in MEMORY_MODES:
+            print(json.dumps(measure_worker_memory(ml_model.models_dir, mode, workers)))
+        
+    elif command == "benchmark_core":
+        args, options = parse_options(sys.argv[2:])
+        
+        load_serving_models(ml_model, compact)
+        
+        print(json.dumps(ml_model.benchmark_inference(int(options.get('calls', 2000))), indent=2))
         
     else:
         print(f"Unknown command: {command}")
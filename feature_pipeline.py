@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Feature Pipeline for Fasal Sathi
+Derives the crop model's climatic features from cached weather, so a crop
+prediction needs only coordinates and soil nutrients
+"""
+
+import json
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+from weather_cache import WeatherGridCache, WeatherStore, DEFAULT_GRID_DEGREES
+from weather_service import WeatherService, CLI_LATENCY_BUDGET
+from enhanced_ml_models import EnhancedMLModel, load_serving_models
+from climate_normals import ClimateNormals, DEFAULT_NORMALS_DIR
+
+# Derived features are reused within a time bucket; an hour matches the
+# hourly group's TTL, so a bucket rarely outlives the data it came from
+DEFAULT_BUCKET_SECONDS = 60 * 60
+
+# Hours of forecast the temperature and humidity averages cover
+FEATURE_HORIZON_HOURS = 24
+
+# Model inputs derived from location; values the caller supplies take precedence
+CLIMATE_FEATURES = ['temperature', 'humidity', 'rainfall']
+
+class ClimateFeaturePipeline:
+    """Coordinates plus soil nutrients in, crop predictions out
+
+    Temperature and humidity are derived from the weather service, rainfall
+    from the climate normals index when one is given. The model is trained on
+    annual rainfall, which a forecast cannot supply: without a normals value
+    the caller must pass rainfall or the sample fails. Features are memoized
+    per grid cell and time bucket, so farms in the same cell share one
+    weather lookup and one derivation. Batches fetch every uncached cell through a
+    single multi-location weather call.
+    """
+
+    def __init__(self, ml_model, weather_service=None, climate_normals=None, grid_degrees=DEFAULT_GRID_DEGREES,
+                 bucket_seconds=DEFAULT_BUCKET_SECONDS, max_entries=10000, clock=time.time):
+        self.ml_model = ml_model
+        self.weather_service = weather_service or WeatherService(cache=WeatherGridCache(grid_degrees))
+        self.climate_normals = climate_normals
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+
+        # The weather cache defines the cells; without one only its keys are used
+        self.cells = self.weather_service.cache or WeatherGridCache(grid_degrees)
+
+        self.features = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def feature_key(self, latitude, longitude):
+        return (self.cells.cell_key(latitude, longitude), int(self.clock() // self.bucket_seconds))
+
+    def derive_features(self, weather_data, latitude, longitude):
+        """Model climatic features from a weather data dict and the climate normals"""
+        metrics = weather_data["agricultural_metrics"]
+        features = {
+            "temperature": metrics[f"avg_temperature_{FEATURE_HORIZON_HOURS}h"],
+            "humidity": metrics[f"avg_humidity_{FEATURE_HORIZON_HOURS}h"]
+        }
+
+        # Left out where the index has no data; predict_batch then needs it from the caller
+        if self.climate_normals is not None:
+            rainfall = self.climate_normals.annual_rainfall_at(latitude, longitude)
+            if rainfall is not None:
+                features["rainfall"] = round(rainfall, 1)
+        return features
+
+    def climate_features(self, coordinates):
+        """Derived features for (latitude, longitude) pairs, in input order
+
+        Entries are feature dicts, or error strings for locations whose
+        weather could not be fetched.
+        """
+        keys = [self.feature_key(latitude, longitude) for latitude, longitude in coordinates]
+
+        found = {}
+        pending = {}
+        with self.lock:
+            for key, location in zip(keys, coordinates):
+                if key in found or key in pending:
+                    continue
+                features = self.features.get(key)
+                if features is not None:
+                    self.features.move_to_end(key)
+                    found[key] = features
+                    self.hits += 1
+                else:
+                    pending[key] = location
+                    self.misses += 1
+
+        if pending:
+            # A single location takes the stale-while-revalidate path with its latency budget
+            if len(pending) == 1:
+                weather = [self.weather_service.get_comprehensive_weather_data(
+                    *next(iter(pending.values())), materialize=False, horizon_hours=FEATURE_HORIZON_HOURS)]
+            else:
+                weather = self.weather_service.get_weather_for_locations(
+                    list(pending.values()), materialize=False, horizon_hours=FEATURE_HORIZON_HOURS)
+            derived = {}
+            for (key, location), weather_data in zip(pending.items(), weather):
+                if weather_data.get("status") == "success":
+                    derived[key] = self.derive_features(weather_data, *location)
+                else:
+                    found[key] = weather_data.get("message", "Weather data unavailable")
+
+            with self.lock:
+                for key, features in derived.items():
+                    self.features[key] = features
+                while len(self.features) > self.max_entries:
+                    self.features.popitem(last=False)
+            found.update(derived)
+
+        return [found[key] for key in keys]
+
+    def predict_batch(self, samples, top_k=5):
+        """Crop predictions for soil dicts carrying latitude and longitude
+
+        Climatic features the caller leaves out are filled from the weather of
+        the sample's cell; each result reports the climate_features it used
+        and which of them were derived.
+        Samples whose weather is unavailable, or that leave out rainfall where
+        there is no climate normals value, get a failed result without
+        holding up the rest.
+        """
+        samples = list(samples)
+        needs_weather = [i for i, sample in enumerate(samples)
+                         if any(feature not in sample for feature in CLIMATE_FEATURES)]
+        climate = self.climate_features([(float(samples[i]['latitude']), float(samples[i]['longitude']))
+                                         for i in needs_weather])
+
+        results = [None] * len(samples)
+        ready = {i: dict(sample) for i, sample in enumerate(samples)}
+        sources = {}
+        for i, features in zip(needs_weather, climate):
+            if isinstance(features, str):
+                results[i] = {"success": False, "error": f"Weather unavailable: {features}"}
+                del ready[i]
+                continue
+            derived = [feature for feature in CLIMATE_FEATURES if feature not in samples[i]]
+            if 'rainfall' in derived and 'rainfall' not in features:
+                results[i] = {"success": False,
+                              "error": "Rainfall unavailable: pass annual 'rainfall' in mm or build a climate normals index"}
+                del ready[i]
+                continue
+            ready[i].update((feature, features[feature]) for feature in derived)
+            sources[i] = {
+                "derived": derived,
+                "rainfall_source": "climate_normals" if 'rainfall' in derived else "caller"
+            }
+
+        if ready:
+            for i, result in zip(ready, self.ml_model.predict_crop_batch(list(ready.values()), top_k)):
+                result["climate_features"] = {feature: ready[i][feature] for feature in CLIMATE_FEATURES}
+                result["climate_features"].update(sources.get(i, {"derived": [], "rainfall_source": "caller"}))
+                results[i] = result
+        return results
+
+    def predict(self, soil_data, top_k=5):
+        """Crop prediction for one soil dict with latitude and longitude"""
+        try:
+            return self.predict_batch([soil_data], top_k)[0]
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "recommended_crop": "maize",  # Safe fallback
+                "confidence": 0.5,
+                "top_recommendations": []
+            }
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.features),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+if __name__ == "__main__":
+    # feature_pipeline.py '<soil json with latitude and longitude>' [--compact]
+    compact = '--compact' in sys.argv
+    if compact:
+        sys.argv.remove('--compact')
+
+    if len(sys.argv) != 2:
+        print("Usage: python feature_pipeline.py '<soil json with latitude and longitude>' [--compact]")
+        sys.exit(1)
+
+    try:
+        soil_data = json.loads(sys.argv[1])
+
+        ml_model = EnhancedMLModel()
+        load_serving_models(ml_model, compact)
+
+        weather_service = WeatherService(cache=WeatherStore(), latency_budget=CLI_LATENCY_BUDGET)
+        climate_normals = ClimateNormals() if os.path.isdir(DEFAULT_NORMALS_DIR) else None
+        pipeline = ClimateFeaturePipeline(ml_model, weather_service, climate_normals)
+        print(json.dumps(pipeline.predict(soil_data), indent=2), flush=True)
+
+        # Let a background weather refresh reach the store before exiting
+        weather_service.wait_for_refreshes(CLI_LATENCY_BUDGET)
+
+    except ValueError:
+        print(json.dumps({"success": False, "error": "Invalid soil data JSON"}))
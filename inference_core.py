@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Inference Core for Fasal Sathi
+Feature assembly, scaling, class probabilities and top-k ranking shared by
+EnhancedMLModel and the ml_pipeline predictors
+"""
+
+import numpy as np
+import threading
+import time
+import warnings
+
+class FeatureLayout:
+    """Model input columns, indexed once
+
+    Samples are dicts keyed by feature name. Features with a default may be
+    left out; the others are required and a sample without one raises
+    KeyError naming it.
+    """
+
+    def __init__(self, feature_names, defaults=None):
+        self.feature_names = list(feature_names)
+        self.defaults = dict(defaults or {})
+        self.column = {name: i for i, name in enumerate(self.feature_names)}
+        self.required = [name for name in self.feature_names if name not in self.defaults]
+
+        # (name, default) per column; None marks a required feature
+        self.lookups = [(name, self.defaults.get(name)) for name in self.feature_names]
+
+        # Per-thread input buffer, grown on demand and reused across calls
+        self.buffers = threading.local()
+
+    def buffer(self, rows):
+        buffer = getattr(self.buffers, 'array', None)
+        if buffer is None or len(buffer) < rows:
+            capacity = max(rows, 2 * len(buffer)) if buffer is not None else max(rows, 1)
+            buffer = np.empty((capacity, len(self.feature_names)))
+            self.buffers.array = buffer
+        return buffer[:rows]
+
+    def fill(self, samples):
+        """N x features matrix of soil dicts, written into this thread's buffer
+
+        The returned array is a view of the buffer: it is valid until the
+        next fill on the same thread, so callers that keep it must copy it.
+        """
+        samples = samples if isinstance(samples, (list, tuple)) else list(samples)
+        matrix = self.buffer(len(samples))
+        for row, sample in enumerate(samples):
+            matrix[row] = [sample[name] if default is None else sample.get(name, default)
+                           for name, default in self.lookups]
+        return matrix
+
+    def frame(self, frame):
+        """Feature matrix of a DataFrame, matching columns case-insensitively
+
+        Missing values of features with a default are filled with it; other
+        missing values stay NaN for the caller to reject per row.
+        """
+        columns = {str(col).lower(): col for col in frame.columns}
+        matrix = np.empty((len(frame), len(self.feature_names)))
+        for i, (name, default) in enumerate(self.lookups):
+            if name in columns:
+                values = frame[columns[name]]
+                if default is not None:
+                    values = values.fillna(default)
+                matrix[:, i] = values.to_numpy(dtype=float)
+            elif default is not None:
+                matrix[:, i] = default
+            else:
+                raise KeyError(name)
+        return matrix
+
+    def matrix(self, samples):
+        """Model input from soil dicts, an array in feature order or a DataFrame"""
+        if hasattr(samples, 'columns'):
+            return self.frame(samples)
+
+        if isinstance(samples, np.ndarray):
+            matrix = np.atleast_2d(samples).astype(float)
+            if matrix.shape[1] != len(self.feature_names):
+                raise ValueError(f"Expected {len(self.feature_names)} feature columns, got {matrix.shape[1]}")
+            return matrix
+
+        return self.fill(samples)
+
+class ScaledModelBackend:
+    """Model backend: a scaler followed by a classifier's predict_proba
+
+    Works with the sklearn artifacts and with the compact array models alike.
+    A standard scaler is applied from its mean_ and scale_ arrays directly,
+    which skips sklearn's per-call input validation.
+    """
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+
+        standard = (getattr(scaler, 'with_mean', True) and getattr(scaler, 'with_std', True)
+                    and getattr(scaler, 'mean_', None) is not None and getattr(scaler, 'scale_', None) is not None)
+        self.mean = np.asarray(scaler.mean_, dtype=float) if standard else None
+        self.scale = np.asarray(scaler.scale_, dtype=float) if standard else None
+
+    def predict_proba(self, features):
+        if self.mean is None:
+            return self.model.predict_proba(self.scaler.transform(features))
+        return self.model.predict_proba((features - self.mean) / self.scale)
+
+class InferenceCore:
+    """One classifier: soil samples in, class probabilities and ranked class names out
+
+    The backend is any object with predict_proba(features) taking unscaled
+    features in layout order, so sklearn, compact or other models plug in
+    unchanged. Class names are looked up by index from arrays built once.
+    """
+
+    def __init__(self, layout, backend, class_names):
+        self.layout = layout
+        self.backend = backend
+        self.classes = np.asarray(class_names)
+        self.class_names = [str(name) for name in self.classes]
+
+    def rank(self, features, top_k):
+        """Probabilities and top-k class indices per row, with one model call"""
+        probabilities = self.backend.predict_proba(features)
+
+        # Stable sort keeps class order for ties, so index 0 is the argmax
+        top_indices = np.argsort(-probabilities, axis=1, kind='stable')[:, :top_k]
+        return probabilities, top_indices
+
+    def predict(self, samples, top_k):
+        """(features, probabilities, top_indices) for soil dicts, an array or a DataFrame"""
+        features = self.layout.matrix(samples)
+        return (features,) + self.rank(features, top_k)
+
+    def top_classes(self, probabilities, top_indices, min_confidence=None):
+        """[(class name, confidence), ...] per row, best first
+
+        With min_confidence only classes above it are listed.
+        """
+        names = self.class_names
+        return [
+            [(names[idx], float(probs[idx])) for idx in indices
+             if min_confidence is None or probs[idx] > min_confidence]
+            for probs, indices in zip(probabilities, top_indices)
+        ]
+
+    def predict_top(self, samples, top_k=3):
+        """Top-k (class name, confidence) list per sample"""
+        _, probabilities, top_indices = self.predict(samples, top_k)
+        return self.top_classes(probabilities, top_indices)
+
+def legacy_top_k(model, scaler, encoder, layout, sample, top_k=3):
+    """The per-call path the predictors took before the core: a fresh input
+    array, scaler.transform, predict plus predict_proba and one
+    inverse_transform per listed class. Kept as the benchmark baseline."""
+    X = np.array([float(sample[name]) if name in sample else layout.defaults[name]
+                  for name in layout.feature_names]).reshape(1, -1)
+    X_scaled = scaler.transform(X)
+    prediction = model.predict(X_scaled)[0]
+    probabilities = model.predict_proba(X_scaled)[0]
+
+    best = encoder.inverse_transform([prediction])[0]
+    top = [(encoder.inverse_transform([idx])[0], float(probabilities[idx]))
+           for idx in np.argsort(probabilities)[-top_k:][::-1]]
+    return best, top
+
+def measure_latency(predict, samples, calls):
+    """Median and 95th percentile wall time of single-sample calls, in microseconds"""
+    predict(samples[0])
+
+    timings = np.empty(calls)
+    for i in range(calls):
+        sample = samples[i % len(samples)]
+        start = time.perf_counter()
+        predict(sample)
+        timings[i] = time.perf_counter() - start
+
+    return {
+        'median_us': round(float(np.median(timings)) * 1e6, 1),
+        'p95_us': round(float(np.percentile(timings, 95)) * 1e6, 1)
+    }
+
+def sample_inputs(core, n_samples=200, seed=42):
+    """Soil dicts of the required features, drawn around the scaler's training mean"""
+    backend = core.backend
+    rng = np.random.default_rng(seed)
+    values = backend.mean + backend.scale * rng.standard_normal((n_samples, len(backend.mean)))
+
+    required = [core.layout.column[name] for name in core.layout.required]
+    return [{core.layout.feature_names[i]: float(row[i]) for i in required} for row in values]
+
+def benchmark_core(core, encoder, samples=None, calls=2000, top_k=3):
+    """Per-call latency of the legacy path against the core on the same models
+
+    core must use a ScaledModelBackend over a standard scaler; encoder is
+    the fitted label encoder the legacy path calls inverse_transform on.
+    Without samples, sample_inputs generates them.
+    """
+    backend = core.backend
+    samples = samples if samples is not None else sample_inputs(core)
+    with warnings.catch_warnings():
+        # A scaler fitted on a DataFrame warns on every bare array it transforms
+        warnings.simplefilter('ignore', UserWarning)
+        legacy = measure_latency(
+            lambda sample: legacy_top_k(backend.model, backend.scaler, encoder, core.layout, sample, top_k),
+            samples, calls
+        )
+    unified = measure_latency(lambda sample: core.predict_top([sample], top_k), samples, calls)
+
+    return {
+        'legacy': legacy,
+        'core': unified,
+        'speedup': round(legacy['median_us'] / unified['median_us'], 2)
+    }
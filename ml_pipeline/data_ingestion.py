@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Dataset Ingestion for Fasal Sathi
+Converts the source CSVs once into typed, column-pruned Parquet files and
+re-ingests only the sources whose contents changed
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Source CSVs by the dataset names FasalSaathiMLPipeline uses
+SOURCE_FILES = {
+    'realistic': 'realistic_crop_soil_dataset.csv',
+    'soil_health': 'ml_soil_health_dataset.csv',
+    'sample': 'sample_soil_health_card_data.csv'
+}
+
+# Columns training reads: features are stored as float32, labels as categories
+FEATURE_COLUMNS = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
+OPTIONAL_FEATURE_COLUMNS = ['ec', 'oc', 's', 'zn', 'fe', 'cu', 'mn', 'b']
+LABEL_COLUMNS = ['soil_type', 'crop_recommended']
+
+INGESTED_DIR_NAME = 'parquet'
+MANIFEST_FILE = 'manifest.json'
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def normalize_frame(df):
+    """Lowercase column names, keep training columns and apply compact dtypes"""
+    df.columns = df.columns.str.lower().str.strip()
+
+    columns = [col for col in FEATURE_COLUMNS + OPTIONAL_FEATURE_COLUMNS + LABEL_COLUMNS if col in df.columns]
+    df = df[columns].copy()
+
+    for col in columns:
+        if col in LABEL_COLUMNS:
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    return df
+
+class DatasetIngestor:
+    """Parquet copies of the source CSVs, tracked by content hash
+
+    The manifest records each source's size, modification time and SHA-256.
+    A source whose size and mtime are unchanged is skipped without hashing;
+    otherwise it is re-ingested only if its hash changed.
+    """
+
+    def __init__(self, datasets_path, output_dir=None):
+        self.datasets_path = Path(datasets_path)
+        self.output_dir = Path(output_dir) if output_dir else self.datasets_path / INGESTED_DIR_NAME
+        self.manifest_path = self.output_dir / MANIFEST_FILE
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write_manifest(self):
+        # Written next to the target and renamed, so readers never see half a manifest
+        temp_path = self.manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def source_changed(self, name, source_path):
+        """Whether a source differs from its ingested copy; returns (changed, sha256)"""
+        entry = self.manifest.get(name)
+        stat = source_path.stat()
+        parquet_path = self.output_dir / f'{name}.parquet'
+
+        if entry is None or not parquet_path.exists():
+            return True, file_sha256(source_path)
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return False, entry['sha256']
+
+        sha256 = file_sha256(source_path)
+        return sha256 != entry['sha256'], sha256
+
+    def ingest(self, force=False):
+        """Convert new or changed sources to Parquet
+
+        Returns the status of every source: 'ingested', 'unchanged' or
+        'missing'. Missing sources lose their Parquet copy and manifest entry.
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        status = {}
+
+        for name, file_name in SOURCE_FILES.items():
+            source_path = self.datasets_path / file_name
+            if not source_path.exists():
+                # Drop the copy of a removed source so load() no longer trains on it
+                status[name] = 'missing'
+                self.manifest.pop(name, None)
+                parquet_path = self.output_dir / f'{name}.parquet'
+                if parquet_path.exists():
+                    parquet_path.unlink()
+                continue
+
+            changed, sha256 = self.source_changed(name, source_path)
+            if not (changed or force):
+                status[name] = 'unchanged'
+                # Touched but identical: remember the new mtime so it is not hashed again
+                stat = source_path.stat()
+                self.manifest[name].update(size=stat.st_size, mtime=stat.st_mtime)
+                continue
+
+            df = normalize_frame(pd.read_csv(source_path))
+            df.to_parquet(self.output_dir / f'{name}.parquet', index=False)
+
+            stat = source_path.stat()
+            self.manifest[name] = {
+                'source': file_name,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'sha256': sha256,
+                'rows': len(df),
+                'columns': list(df.columns)
+            }
+            status[name] = 'ingested'
+            print(f"✅ Ingested {file_name}: {df.shape}")
+
+        self.write_manifest()
+        return status
+
+    def load(self, columns=None):
+        """Ingested datasets by name, reading only the requested columns
+
+        Columns a dataset lacks are skipped for that dataset, as the CSV path
+        does with optional features.
+        """
+        datasets = {}
+        for name, entry in self.manifest.items():
+            parquet_path = self.output_dir / f'{name}.parquet'
+            if not parquet_path.exists():
+                continue
+
+            wanted = entry['columns'] if columns is None else [col for col in columns if col in entry['columns']]
+            datasets[name] = pd.read_parquet(parquet_path, columns=wanted)
+        return datasets
+
+def load_csv_sources(datasets_path):
+    """The original path: every source CSV with default dtypes"""
+    datasets = {}
+    for name, file_name in SOURCE_FILES.items():
+        source_path = Path(datasets_path) / file_name
+        if source_path.exists():
+            datasets[name] = pd.read_csv(source_path)
+    return datasets
+
+def measure_load(load):
+    """Wall time and in-memory DataFrame size of one load"""
+    start = time.perf_counter()
+    datasets = load()
+    seconds = time.perf_counter() - start
+
+    return {
+        'seconds': round(seconds, 4),
+        'rows': sum(len(df) for df in datasets.values()),
+        'frame_mb': round(sum(df.memory_usage(deep=True).sum() for df in datasets.values()) / 1e6, 2)
+    }
+
+def compare_load_paths(datasets_path, output_dir=None):
+    """Load time and memory of the CSV path against the ingested Parquet path"""
+    ingestor = DatasetIngestor(datasets_path, output_dir)
+    ingestor.ingest()
+    columns = FEATURE_COLUMNS + OPTIONAL_FEATURE_COLUMNS + LABEL_COLUMNS
+
+    return {
+        'csv': measure_load(lambda: load_csv_sources(datasets_path)),
+        'parquet': measure_load(lambda: ingestor.load(columns))
+    }
+
+if __name__ == "__main__":
+    # data_ingestion.py ingest|compare [datasets_path] [--force]
+    force = '--force' in sys.argv
+    if force:
+        sys.argv.remove('--force')
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in ('ingest', 'compare'):
+        print("Usage: python data_ingestion.py ingest [datasets_path] [--force]")
+        print("       python data_ingestion.py compare [datasets_path]")
+        sys.exit(1)
+
+    datasets_path = sys.argv[2] if len(sys.argv) == 3 else '../Datasets'
+
+    if sys.argv[1] == 'ingest':
+        print(json.dumps(DatasetIngestor(datasets_path).ingest(force), indent=2))
+    else:
+        print(json.dumps(compare_load_paths(datasets_path), indent=2))
@@ -6,55 +6,56 @@ Converts trained models to lightweight formats and creates prediction APIs
 
 import joblib
 import numpy as np
-import pandas as pd
 import json
 import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import cv2
-from sklearn.base import BaseEstimator, TransformerMixin
+from fixed_predictor import load_pipeline_models
+
+# tensorflow is imported only when the image model is first needed, so the
+# tabular predictors start without it
+
+IMAGE_MODEL_FILE = 'soil_image_classifier.h5'
+IMAGE_ENCODER_FILE = 'image_encoder.joblib'
+TFLITE_MODEL_FILE = 'soil_image_classifier.tflite'
+IMAGE_BACKENDS = ['keras', 'tflite']
+
+# Images per forward pass; larger batches amortize per-call overhead on CPU
+DEFAULT_IMAGE_BATCH_SIZE = 32
 
 class ModelPredictor:
     """Lightweight model predictor for Android integration"""
     
-    def __init__(self, models_path="models"):
+    def __init__(self, models_path="models", image_backend='keras'):
+        if image_backend not in IMAGE_BACKENDS:
+            raise ValueError(f"image_backend must be one of {IMAGE_BACKENDS}")
+        
         self.models_path = Path(models_path)
+        self.cores = {}
         self.models = {}
-        self.scalers = {}
         self.encoders = {}
         
+        # The image classifier is loaded on first use, once, under this lock
+        self.image_backend = image_backend
+        self.image_model_lock = threading.Lock()
+        self.image_input_shape = None
+        
         self.load_models()
     
-    def load_models(self):
-        """Load all trained models"""
+    def load_models(self, mmap_mode='r'):
+        """Load all trained models
+        
+        The tabular models are served through the same inference cores as
+        FixedModelPredictor; this class only shapes their results.
+        """
         try:
-            # Load crop recommendation model
-            if (self.models_path / 'crop_recommendation_model.joblib').exists():
-                self.models['crop_recommendation'] = joblib.load(
-                    self.models_path / 'crop_recommendation_model.joblib'
-                )
-                self.scalers['crop_scaler'] = joblib.load(
-                    self.models_path / 'crop_scaler.joblib'
-                )
-                self.encoders['crop_encoder'] = joblib.load(
-                    self.models_path / 'crop_encoder.joblib'
-                )
-                print("✅ Crop recommendation model loaded")
-            
-            # Load soil type model
-            if (self.models_path / 'soil_type_model.joblib').exists():
-                self.models['soil_type'] = joblib.load(
-                    self.models_path / 'soil_type_model.joblib'
-                )
-                self.scalers['soil_scaler'] = joblib.load(
-                    self.models_path / 'soil_scaler.joblib'
-                )
-                self.encoders['soil_encoder'] = joblib.load(
-                    self.models_path / 'soil_encoder.joblib'
-                )
-                print("✅ Soil type model loaded")
-                
+            self.cores, encoders = load_pipeline_models(self.models_path, mmap_mode)
+            self.encoders.update(encoders)
         except Exception as e:
-            print(f"❌ Error loading models: {e}")
+            print(f"❌ Error loading models: {e}", file=sys.stderr)
     
     def predict_crop(self, soil_data):
         """
@@ -69,66 +70,26 @@ class ModelPredictor:
                 - temperature: Temperature in Celsius
                 - humidity: Humidity percentage
                 - rainfall: Rainfall in mm
-                - Optional: ec, oc, s, zn, fe, cu, mn, b
+                - Optional: ec, oc, s, zn, fe, cu, mn, b (training defaults when left out)
         
         Returns:
             dict: Prediction results with crop name and confidence
         """
         try:
-            if 'crop_recommendation' not in self.models:
+            if 'crop_recommendation' not in self.cores:
                 return {"error": "Crop recommendation model not available"}
             
-            # Prepare input data
-            input_features = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
-            optional_features = ['ec', 'oc', 's', 'zn', 'fe', 'cu', 'mn', 'b']
-            
-            # Create feature vector
-            features = []
-            feature_names = []
-            
-            for feature in input_features:
-                if feature in soil_data:
-                    features.append(float(soil_data[feature]))
-                    feature_names.append(feature)
-                else:
-                    return {"error": f"Missing required feature: {feature}"}
-            
-            # Add optional features if available
-            for feature in optional_features:
-                if feature in soil_data:
-                    features.append(float(soil_data[feature]))
-                    feature_names.append(feature)
-            
-            # Convert to numpy array and reshape
-            X = np.array(features).reshape(1, -1)
-            
-            # Scale features
-            X_scaled = self.scalers['crop_scaler'].transform(X)
-            
-            # Make prediction
-            prediction = self.models['crop_recommendation'].predict(X_scaled)[0]
-            probabilities = self.models['crop_recommendation'].predict_proba(X_scaled)[0]
-            
-            # Get crop name
-            crop_name = self.encoders['crop_encoder'].inverse_transform([prediction])[0]
-            confidence = float(max(probabilities))
-            
-            # Get top 3 recommendations
-            top_indices = np.argsort(probabilities)[-3:][::-1]
-            top_crops = []
-            
-            for idx in top_indices:
-                crop = self.encoders['crop_encoder'].inverse_transform([idx])[0]
-                prob = float(probabilities[idx])
-                top_crops.append({"crop": crop, "confidence": prob})
-            
+            # Top 3 recommendations, best first
+            top = self.cores['crop_recommendation'].predict_top([soil_data], 3)[0]
             return {
-                "recommended_crop": crop_name,
-                "confidence": confidence,
-                "top_recommendations": top_crops,
+                "recommended_crop": top[0][0],
+                "confidence": top[0][1],
+                "top_recommendations": [{"crop": crop, "confidence": prob} for crop, prob in top],
                 "success": True
             }
             
+        except KeyError as e:
+            return {"error": f"Missing required feature: {e.args[0]}"}
         except Exception as e:
             return {"error": str(e), "success": False}
     
@@ -143,50 +104,130 @@ class ModelPredictor:
             dict: Prediction results with soil type and confidence
         """
         try:
-            if 'soil_type' not in self.models:
+            if 'soil_type' not in self.cores:
                 return {"error": "Soil type model not available"}
             
-            # Prepare input data (same as crop prediction)
-            input_features = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
-            optional_features = ['ec', 'oc', 's', 'zn', 'fe', 'cu', 'mn', 'b']
-            
-            features = []
-            for feature in input_features:
-                if feature in soil_data:
-                    features.append(float(soil_data[feature]))
-                else:
-                    return {"error": f"Missing required feature: {feature}"}
-            
-            for feature in optional_features:
-                if feature in soil_data:
-                    features.append(float(soil_data[feature]))
-            
-            # Convert to numpy array and reshape
-            X = np.array(features).reshape(1, -1)
-            
-            # Scale features
-            X_scaled = self.scalers['soil_scaler'].transform(X)
-            
-            # Make prediction
-            prediction = self.models['soil_type'].predict(X_scaled)[0]
-            probabilities = self.models['soil_type'].predict_proba(X_scaled)[0]
-            
-            # Get soil type name
-            soil_type = self.encoders['soil_encoder'].inverse_transform([prediction])[0]
-            confidence = float(max(probabilities))
-            
+            soil_type, confidence = self.cores['soil_type'].predict_top([soil_data], 1)[0][0]
             return {
                 "soil_type": soil_type,
                 "confidence": confidence,
                 "success": True
             }
             
+        except KeyError as e:
+            return {"error": f"Missing required feature: {e.args[0]}"}
         except Exception as e:
             return {"error": str(e), "success": False}
     
+    def load_image_model(self):
+        """Load the soil image classifier and its label encoder once
+        
+        With the 'tflite' backend the quantized export is run by the TFLite
+        interpreter instead of Keras. Returns the class names.
+        """
+        with self.image_model_lock:
+            if 'soil_image' in self.models:
+                return self.encoders['image_encoder'].classes_
+            
+            import tensorflow as tf
+            
+            encoder = joblib.load(self.models_path / IMAGE_ENCODER_FILE)
+            if self.image_backend == 'tflite':
+                interpreter = tf.lite.Interpreter(
+                    model_path=str(self.models_path / TFLITE_MODEL_FILE), num_threads=os.cpu_count()
+                )
+                interpreter.allocate_tensors()
+                self.models['soil_image'] = interpreter
+            else:
+                self.models['soil_image'] = tf.keras.models.load_model(
+                    self.models_path / IMAGE_MODEL_FILE, compile=False
+                )
+            self.encoders['image_encoder'] = encoder
+            print(f"✅ Soil image model loaded ({self.image_backend})", file=sys.stderr)
+            return encoder.classes_
+    
+    def image_probabilities(self, images):
+        """Class probabilities for a batch of uint8 images in one forward pass"""
+        from soil_image_dataset import preprocess_batch
+        
+        batch = preprocess_batch(images)
+        model = self.models['soil_image']
+        if self.image_backend == 'keras':
+            return np.asarray(model.predict_on_batch(batch))
+        
+        # The interpreter is stateful: one batch at a time, resized on demand
+        with self.image_model_lock:
+            input_detail = model.get_input_details()[0]
+            if self.image_input_shape != batch.shape:
+                model.resize_tensor_input(input_detail['index'], batch.shape)
+                model.allocate_tensors()
+                self.image_input_shape = batch.shape
+            model.set_tensor(input_detail['index'], batch)
+            model.invoke()
+            return model.get_tensor(model.get_output_details()[0]['index'])
+    
+    def predict_images(self, images, batch_size=DEFAULT_IMAGE_BATCH_SIZE, top_k=3, workers=4):
+        """
+        Predict soil types for many images, batch_size per forward pass
+        
+        Args:
+            images: Image paths, or RGB uint8 arrays already resized
+            batch_size (int): Images per model call
+            top_k (int): Alternatives listed per image
+            workers (int): Threads decoding image files
+        
+        Returns:
+            list: One predict_from_image-shaped result per image, in order
+        """
+        from soil_image_dataset import decode_image
+        
+        images = list(images)
+        try:
+            class_names = self.load_image_model()
+        except Exception as e:
+            return [{"error": f"Soil image model not available: {e}", "success": False} for _ in images]
+        
+        def load(image):
+            if isinstance(image, np.ndarray):
+                return image
+            try:
+                return decode_image(image)
+            except Exception:
+                return None
+        
+        # Same decode/resize as training; cv2 releases the GIL, so files decode in parallel
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            decoded = list(executor.map(load, images))
+        
+        results = [{"error": "Could not read image", "success": False} if img is None else None for img in decoded]
+        valid = [i for i, img in enumerate(decoded) if img is not None]
+        
+        for start in range(0, len(valid), batch_size):
+            batch_indices = valid[start:start + batch_size]
+            try:
+                probabilities = self.image_probabilities(np.stack([decoded[i] for i in batch_indices]))
+            except Exception as e:
+                for i in batch_indices:
+                    results[i] = {"error": str(e), "success": False}
+                continue
+            
+            top_indices = np.argsort(-probabilities, axis=1, kind='stable')[:, :top_k]
+            for i, probs, indices in zip(batch_indices, probabilities, top_indices):
+                results[i] = {
+                    "soil_type": str(class_names[indices[0]]),
+                    "confidence": float(probs[indices[0]]),
+                    "top_predictions": [
+                        {"soil_type": str(class_names[idx]), "confidence": float(probs[idx])} for idx in indices
+                    ],
+                    "success": True,
+                    "method": "image_analysis"
+                }
+        
+        return results
+    
     def predict_from_image(self, image_path):
         """
-        Predict soil type from image (placeholder - requires image model)
+        Predict soil type from image with the trained CNN
         
         Args:
             image_path (str): Path to soil image
@@ -194,14 +235,55 @@ class ModelPredictor:
         Returns:
             dict: Prediction results
         """
-        # This would integrate with the trained CNN model
-        # For now, return a placeholder
-        return {
-            "soil_type": "Alluvial",
-            "confidence": 0.85,
-            "success": True,
-            "method": "image_analysis"
-        }
+        return self.predict_images([image_path])[0]
+    
+    def export_tflite(self, output_path=None, quantize=True):
+        """Convert the Keras image classifier to TFLite
+        
+        quantize applies dynamic-range quantization: int8 weights, about a
+        quarter of the size, with float activations so no calibration data
+        is needed.
+        """
+        import tensorflow as tf
+        
+        model = tf.keras.models.load_model(self.models_path / IMAGE_MODEL_FILE, compile=False)
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if quantize:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        
+        output_path = Path(output_path) if output_path else self.models_path / TFLITE_MODEL_FILE
+        output_path.write_bytes(converter.convert())
+        return output_path
+
+def benchmark_image_inference(models_path="models", backends=IMAGE_BACKENDS, batch_sizes=(1, 8, 32, 64),
+                              n_images=256, seed=42):
+    """CPU throughput of the image classifier in images per second
+    
+    Runs the forward pass only, on random 224x224 images, for every backend
+    whose artifact exists and every batch size. One warm-up batch is run
+    first so graph tracing and tensor allocation are not counted.
+    """
+    from soil_image_dataset import IMAGE_SIZE
+    
+    images = np.random.default_rng(seed).integers(0, 256, (n_images, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    artifacts = {'keras': IMAGE_MODEL_FILE, 'tflite': TFLITE_MODEL_FILE}
+    
+    report = {}
+    for backend in backends:
+        if not (Path(models_path) / artifacts[backend]).exists():
+            continue
+        predictor = ModelPredictor(models_path, image_backend=backend)
+        predictor.load_image_model()
+        
+        report[backend] = {}
+        for batch_size in batch_sizes:
+            predictor.image_probabilities(images[:batch_size])
+            start = time.perf_counter()
+            for offset in range(0, n_images, batch_size):
+                predictor.image_probabilities(images[offset:offset + batch_size])
+            report[backend][batch_size] = round(n_images / (time.perf_counter() - start), 1)
+    
+    return report
 
 def create_android_integration_files():
     """Create files for Android integration"""
@@ -325,6 +407,26 @@ def test_models():
     print(json.dumps(soil_result, indent=2))
 
 if __name__ == "__main__":
+    # image <path> [...] [--tflite] predicts soil type from photos
+    if len(sys.argv) >= 3 and sys.argv[1] == "image":
+        backend = 'tflite' if '--tflite' in sys.argv else 'keras'
+        paths = [arg for arg in sys.argv[2:] if arg != '--tflite']
+        predictor = ModelPredictor(image_backend=backend)
+        results = predictor.predict_images(paths)
+        print(json.dumps(results[0] if len(results) == 1 else results, indent=2))
+        sys.exit(0)
+    
+    # export_tflite writes the quantized TFLite copy of the image classifier
+    if len(sys.argv) == 2 and sys.argv[1] == "export_tflite":
+        output_path = ModelPredictor().export_tflite()
+        print(f"💾 TFLite model saved to {output_path} ({output_path.stat().st_size / 1024:.0f} KB)")
+        sys.exit(0)
+    
+    # benchmark_images reports images/sec per backend and batch size
+    if len(sys.argv) == 2 and sys.argv[1] == "benchmark_images":
+        print(json.dumps(benchmark_image_inference(), indent=2))
+        sys.exit(0)
+    
     print("🚀 Setting up model deployment...")
     
     # Test models
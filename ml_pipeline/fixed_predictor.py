@@ -6,83 +6,113 @@ Handles proper feature matching and provides fallback values
 
 import joblib
 import numpy as np
-import pandas as pd
 import json
-import os
+import sys
 from pathlib import Path
 
+# The inference core is shared with the app's EnhancedMLModel one directory up
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from inference_core import FeatureLayout, ScaledModelBackend, InferenceCore, benchmark_core
+
+# Soil health card column names (lowercased) that differ from the feature names
+CSV_COLUMN_MAP = {
+    'n_kg_per_ha': 'n', 'p_kg_per_ha': 'p', 'k_kg_per_ha': 'k',
+    'ec_ds_per_m': 'ec', 'oc_percent': 'oc', 's_ppm': 's', 'zn_ppm': 'zn',
+    'fe_ppm': 'fe', 'cu_ppm': 'cu', 'mn_ppm': 'mn', 'b_ppm': 'b'
+}
+CSV_ID_COLUMNS = ['farmer_id', 'id']
+
+# Expected feature order (based on training), used when a scaler did not
+# record its column names
+EXPECTED_FEATURES = [
+    'n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall',
+    'ec', 'oc', 's', 'zn', 'fe', 'cu', 'mn', 'b'
+]
+
+# Default values for optional features; every other feature must be supplied by the caller
+DEFAULT_VALUES = {
+    'ec': 1.0, 'oc': 0.8, 's': 15.0, 'zn': 1.0, 'fe': 8.0,
+    'cu': 1.0, 'mn': 3.0, 'b': 0.5
+}
+
+# Tabular models by name: (model, scaler, encoder) files and the name used in messages
+MODEL_FILES = {
+    'crop_recommendation': ('crop_recommendation_model.joblib', 'crop_scaler.joblib', 'crop_encoder.joblib'),
+    'soil_type': ('soil_type_model.joblib', 'soil_scaler.joblib', 'soil_encoder.joblib')
+}
+MODEL_LABELS = {'crop_recommendation': 'Crop recommendation', 'soil_type': 'Soil type'}
+
+def load_pipeline_models(models_path, mmap_mode='r'):
+    """Inference cores and label encoders of the tabular models in models_path
+    
+    Arrays in the uncompressed joblib artifacts are memory-mapped, so
+    predictors loading the same files share pages. Each core's feature
+    layout follows the column names its scaler was fitted on, when recorded.
+    """
+    models_path = Path(models_path)
+    cores = {}
+    encoders = {}
+    
+    for name, (model_file, scaler_file, encoder_file) in MODEL_FILES.items():
+        if not (models_path / model_file).exists():
+            continue
+        
+        model = joblib.load(models_path / model_file, mmap_mode=mmap_mode)
+        scaler = joblib.load(models_path / scaler_file, mmap_mode=mmap_mode)
+        encoder = joblib.load(models_path / encoder_file, mmap_mode=mmap_mode)
+        
+        feature_names = getattr(scaler, 'feature_names_in_', None)
+        layout = FeatureLayout(EXPECTED_FEATURES if feature_names is None else feature_names, DEFAULT_VALUES)
+        cores[name] = InferenceCore(layout, ScaledModelBackend(model, scaler), encoder.classes_)
+        encoders[name] = encoder
+        print(f"✅ {MODEL_LABELS[name]} model loaded", file=sys.stderr)
+    
+    return cores, encoders
+
+def missing_feature_error(error):
+    """Result for the KeyError a core raises on a missing required feature"""
+    return {"error": f"Missing required feature: {error.args[0]}", "success": False}
+
 class FixedModelPredictor:
-    """Improved model predictor with proper feature handling"""
+    """Improved model predictor with proper feature handling
+    
+    A thin adapter over the inference core: feature assembly, scaling and
+    ranking happen there, this class only shapes the results.
+    """
     
     def __init__(self, models_path="models"):
         self.models_path = Path(models_path)
-        self.models = {}
-        self.scalers = {}
+        self.cores = {}
         self.encoders = {}
         
-        # Expected feature order (based on training)
-        self.expected_features = [
-            'n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall',
-            'ec', 'oc', 's', 'zn', 'fe', 'cu', 'mn', 'b'
-        ]
-        
-        # Default values for optional features
-        self.default_values = {
-            'ec': 1.0, 'oc': 0.8, 's': 15.0, 'zn': 1.0, 'fe': 8.0, 
-            'cu': 1.0, 'mn': 3.0, 'b': 0.5
-        }
+        self.expected_features = EXPECTED_FEATURES
+        self.required_features = [feature for feature in EXPECTED_FEATURES if feature not in DEFAULT_VALUES]
+        self.default_values = DEFAULT_VALUES
         
         self.load_models()
     
-    def load_models(self):
+    def load_models(self, mmap_mode='r'):
         """Load all trained models"""
         try:
-            # Load crop recommendation model
-            if (self.models_path / 'crop_recommendation_model.joblib').exists():
-                self.models['crop_recommendation'] = joblib.load(
-                    self.models_path / 'crop_recommendation_model.joblib'
-                )
-                self.scalers['crop_scaler'] = joblib.load(
-                    self.models_path / 'crop_scaler.joblib'
-                )
-                self.encoders['crop_encoder'] = joblib.load(
-                    self.models_path / 'crop_encoder.joblib'
-                )
-                print("✅ Crop recommendation model loaded")
-            
-            # Load soil type model
-            if (self.models_path / 'soil_type_model.joblib').exists():
-                self.models['soil_type'] = joblib.load(
-                    self.models_path / 'soil_type_model.joblib'
-                )
-                self.scalers['soil_scaler'] = joblib.load(
-                    self.models_path / 'soil_scaler.joblib'
-                )
-                self.encoders['soil_encoder'] = joblib.load(
-                    self.models_path / 'soil_encoder.joblib'
-                )
-                print("✅ Soil type model loaded")
-                
+            self.cores, self.encoders = load_pipeline_models(self.models_path, mmap_mode)
         except Exception as e:
-            print(f"❌ Error loading models: {e}")
-    
-    def prepare_features(self, soil_data):
-        """Prepare feature vector with proper ordering and default values"""
-        features = []
-        
-        for feature in self.expected_features:
-            if feature in soil_data:
-                features.append(float(soil_data[feature]))
-            elif feature in self.default_values:
-                features.append(self.default_values[feature])
-            else:
-                # For required features, return error
-                required_features = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
-                if feature in required_features:
-                    return None, f"Missing required feature: {feature}"
-                features.append(0.0)  # Default to 0 for any missing feature
-        
-        return np.array(features).reshape(1, -1), None
+            print(f"❌ Error loading models: {e}", file=sys.stderr)
+    
+    def crop_result(self, top):
+        return {
+            "recommended_crop": top[0][0],
+            "confidence": top[0][1],
+            "top_recommendations": [{"crop": crop, "confidence": prob} for crop, prob in top],
+            "success": True
+        }
+    
+    def soil_result(self, top):
+        return {
+            "soil_type": top[0][0],
+            "confidence": top[0][1],
+            "top_predictions": [{"soil_type": soil, "confidence": prob} for soil, prob in top],
+            "success": True
+        }
     
     def predict_crop(self, soil_data):
         """
@@ -97,41 +127,15 @@ class FixedModelPredictor:
             dict: Prediction results with crop name and confidence
         """
         try:
-            if 'crop_recommendation' not in self.models:
+            if 'crop_recommendation' not in self.cores:
                 return {"error": "Crop recommendation model not available", "success": False}
             
-            # Prepare feature vector
-            X, error = self.prepare_features(soil_data)
-            if error:
-                return {"error": error, "success": False}
-            
-            # Scale features
-            X_scaled = self.scalers['crop_scaler'].transform(X)
-            
-            # Make prediction
-            prediction = self.models['crop_recommendation'].predict(X_scaled)[0]
-            probabilities = self.models['crop_recommendation'].predict_proba(X_scaled)[0]
-            
-            # Get crop name
-            crop_name = self.encoders['crop_encoder'].inverse_transform([prediction])[0]
-            confidence = float(max(probabilities))
-            
-            # Get top 3 recommendations
-            top_indices = np.argsort(probabilities)[-3:][::-1]
-            top_crops = []
-            
-            for idx in top_indices:
-                crop = self.encoders['crop_encoder'].inverse_transform([idx])[0]
-                prob = float(probabilities[idx])
-                top_crops.append({"crop": crop, "confidence": prob})
-            
-            return {
-                "recommended_crop": crop_name,
-                "confidence": confidence,
-                "top_recommendations": top_crops,
-                "success": True
-            }
+            # Top 3 recommendations, best first
+            top = self.cores['crop_recommendation'].predict_top([soil_data], 3)[0]
+            return self.crop_result(top)
             
+        except KeyError as e:
+            return missing_feature_error(e)
         except Exception as e:
             return {"error": str(e), "success": False}
     
@@ -146,47 +150,111 @@ class FixedModelPredictor:
             dict: Prediction results with soil type and confidence
         """
         try:
-            if 'soil_type' not in self.models:
+            if 'soil_type' not in self.cores:
                 return {"error": "Soil type model not available", "success": False}
             
-            # Prepare feature vector
-            X, error = self.prepare_features(soil_data)
-            if error:
-                return {"error": error, "success": False}
-            
-            # Scale features
-            X_scaled = self.scalers['soil_scaler'].transform(X)
-            
-            # Make prediction
-            prediction = self.models['soil_type'].predict(X_scaled)[0]
-            probabilities = self.models['soil_type'].predict_proba(X_scaled)[0]
-            
-            # Get soil type name
-            soil_type = self.encoders['soil_encoder'].inverse_transform([prediction])[0]
-            confidence = float(max(probabilities))
-            
-            # Get top 3 soil type predictions
-            top_indices = np.argsort(probabilities)[-3:][::-1]
-            top_soils = []
-            
-            for idx in top_indices:
-                soil = self.encoders['soil_encoder'].inverse_transform([idx])[0]
-                prob = float(probabilities[idx])
-                top_soils.append({"soil_type": soil, "confidence": prob})
-            
-            return {
-                "soil_type": soil_type,
-                "confidence": confidence,
-                "top_predictions": top_soils,
-                "success": True
-            }
+            # Top 3 soil type predictions, best first
+            top = self.cores['soil_type'].predict_top([soil_data], 3)[0]
+            return self.soil_result(top)
             
+        except KeyError as e:
+            return missing_feature_error(e)
         except Exception as e:
             return {"error": str(e), "success": False}
+    
+    def score_model(self, model_name, frame, make_result, top_k=3):
+        """One result per DataFrame row from one model, scored in a single call
+        
+        Rows with missing required values fail individually.
+        """
+        core = self.cores.get(model_name)
+        if core is None:
+            return [{"error": f"{MODEL_LABELS[model_name]} model not available", "success": False}] * len(frame)
+        
+        try:
+            X = core.layout.frame(frame)
+        except KeyError as e:
+            return [missing_feature_error(e)] * len(frame)
+        
+        valid = ~np.isnan(X).any(axis=1)
+        results = [{"error": "Missing feature values", "success": False}] * len(X)
+        if valid.any():
+            probabilities, top_indices = core.rank(X[valid], top_k)
+            for i, top in zip(np.flatnonzero(valid), core.top_classes(probabilities, top_indices)):
+                results[i] = make_result(top)
+        return results
+    
+    def score_frame(self, frame):
+        """Score a DataFrame chunk, returning (crop_results, soil_results)"""
+        return (self.score_model('crop_recommendation', frame, self.crop_result),
+                self.score_model('soil_type', frame, self.soil_result))
+    
+    def benchmark(self, calls=2000):
+        """Per-call latency of the pre-core predict path against the core, per model"""
+        return {name: benchmark_core(core, self.encoders[name], calls=calls) for name, core in self.cores.items()}
+    
+    def score_csv(self, input_path, output_path, chunksize=10000, defaults=None):
+        """
+        Stream a soil health card CSV through the models in fixed-size chunks
+        
+        Args:
+            input_path (str): CSV with soil columns (N_kg_per_ha, pH, EC_dS_per_m, ...)
+            output_path (str): Results file, JSON lines if it ends in .jsonl else CSV
+            chunksize (int): Rows read and scored per chunk
+            defaults (dict): Values for features the file does not contain
+        
+        Returns:
+            int: Number of rows scored
+        """
+        # Only batch scoring needs pandas; keep it off the single-prediction import path
+        import pandas as pd
+        
+        defaults = dict(defaults or {})
+        
+        # Map file columns to features using the header only
+        header = pd.read_csv(input_path, nrows=0).columns
+        rename = {}
+        for column in header:
+            feature = CSV_COLUMN_MAP.get(column.lower(), column.lower())
+            if feature in self.expected_features and feature not in rename.values():
+                rename[column] = feature
+        
+        id_column = next((col for col in header if col.lower() in CSV_ID_COLUMNS), None)
+        usecols = list(rename) + ([id_column] if id_column and id_column not in rename else [])
+        as_jsonl = str(output_path).endswith('.jsonl')
+        rows_scored = 0
+        
+        with open(output_path, 'w', newline='') as out:
+            for chunk in pd.read_csv(input_path, usecols=usecols, chunksize=chunksize):
+                ids = chunk[id_column].tolist() if id_column else list(range(rows_scored, rows_scored + len(chunk)))
+                chunk = chunk.rename(columns=rename)
+                for feature, value in defaults.items():
+                    if feature not in chunk.columns:
+                        chunk[feature] = value
+                
+                crop_results, soil_results = self.score_frame(chunk)
+                
+                if as_jsonl:
+                    for row_id, crop, soil in zip(ids, crop_results, soil_results):
+                        out.write(json.dumps({"id": row_id, "crop": crop, "soil": soil}) + "\n")
+                else:
+                    pd.DataFrame({
+                        "id": ids,
+                        "success": [crop["success"] and soil["success"] for crop, soil in zip(crop_results, soil_results)],
+                        "recommended_crop": [crop.get("recommended_crop") for crop in crop_results],
+                        "crop_confidence": [crop.get("confidence") for crop in crop_results],
+                        "soil_type": [soil.get("soil_type") for soil in soil_results],
+                        "soil_confidence": [soil.get("confidence") for soil in soil_results]
+                    }).to_csv(out, header=rows_scored == 0, index=False)
+                
+                rows_scored += len(chunk)
+                print(f"  ✅ Scored {rows_scored} rows", file=sys.stderr)
+        
+        return rows_scored
 
 def test_fixed_models():
     """Test the fixed models with sample data"""
-    print("🧪 Testing fixed models...")
+    print("🧪 Testing fixed models...", file=sys.stderr)
     
     predictor = FixedModelPredictor()
     
@@ -231,4 +299,16 @@ def test_fixed_models():
     print(json.dumps(detailed_crop_result, indent=2))
 
 if __name__ == "__main__":
-    test_fixed_models()
\ No newline at end of file
+    if len(sys.argv) >= 4 and sys.argv[1] == "score_csv":
+        # python fixed_predictor.py score_csv <input.csv> <output.csv|jsonl> [defaults_json]
+        predictor = FixedModelPredictor()
+        defaults = json.loads(sys.argv[4]) if len(sys.argv) > 4 else None
+        rows = predictor.score_csv(sys.argv[2], sys.argv[3], defaults=defaults)
+        print(f"💾 Scored {rows} rows to {sys.argv[3]}", file=sys.stderr)
+    elif len(sys.argv) in (2, 3) and sys.argv[1] == "benchmark":
+        # python fixed_predictor.py benchmark [calls]
+        predictor = FixedModelPredictor()
+        calls = int(sys.argv[2]) if len(sys.argv) == 3 else 2000
+        print(json.dumps(predictor.benchmark(calls), indent=2))
+    else:
+        test_fixed_models()
\ No newline at end of file
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Soil Image Dataset for Fasal Sathi
+Decodes soil photos once, in parallel threads, into a uint8 memory-mapped
+cache and streams normalized batches from it to the image classifier
+"""
+
+import numpy as np
+import cv2
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tensorflow import keras
+
+IMAGE_SIZE = 224
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+
+# cv2 releases the GIL while decoding and resizing, so threads scale
+DEFAULT_DECODE_WORKERS = min(8, os.cpu_count() or 1)
+
+CACHE_IMAGES_FILE = 'soil_images.npy'
+CACHE_META_FILE = 'soil_images.json'
+
+def list_soil_images(dataset_path):
+    """Image paths and soil names of a class-per-directory dataset such as CyAUG"""
+    paths = []
+    labels = []
+    for soil_type in sorted(Path(dataset_path).iterdir()):
+        if soil_type.is_dir():
+            soil_name = soil_type.name.replace('_', ' ').replace('Soil', '').strip()
+            for img_file in sorted(soil_type.glob("*")):
+                if img_file.suffix.lower() in IMAGE_EXTENSIONS:
+                    paths.append(str(img_file))
+                    labels.append(soil_name)
+    return paths, labels
+
+def decode_image(path, size=IMAGE_SIZE):
+    """RGB uint8 image resized to size x size, or None if it cannot be read"""
+    img = cv2.imread(str(path))
+    if img is None:
+        return None
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.resize(img, (size, size))
+
+def preprocess_batch(images):
+    """uint8 images to the float32 [0, 1] model input"""
+    return np.asarray(images, dtype=np.float32) / 255.0
+
+def files_signature(paths):
+    """Hash of every path with its size and mtime, to tell when a cache is stale"""
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+def decode_into_file(paths, images_path, size=IMAGE_SIZE, workers=DEFAULT_DECODE_WORKERS):
+    """Decode images in parallel straight into a new uint8 .npy file
+
+    Returns a bool array marking the images that decoded; failed slots are
+    left zeroed. The file is flushed and unmapped on return.
+    """
+    images = np.lib.format.open_memmap(images_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(paths), size, size, 3))
+
+    def decode_into(index):
+        try:
+            img = decode_image(paths[index], size)
+        except Exception:
+            return False
+        if img is None:
+            return False
+        images[index] = img
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        decoded = np.fromiter(executor.map(decode_into, range(len(paths))), dtype=bool, count=len(paths))
+    images.flush()
+    return decoded
+
+def build_image_cache(paths, labels, cache_dir, size=IMAGE_SIZE, workers=DEFAULT_DECODE_WORKERS):
+    """Decode every image into <cache_dir>/soil_images.npy and return it memory-mapped
+
+    The cache is reused while the image files are unchanged. Images that fail
+    to decode are dropped. Returns (images, labels) with images an
+    N x size x size x 3 uint8 memmap.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    images_path = cache_dir / CACHE_IMAGES_FILE
+    meta_path = cache_dir / CACHE_META_FILE
+
+    signature = files_signature(paths)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['signature'] == signature and meta['size'] == size and images_path.exists():
+            return np.load(images_path, mmap_mode='r'), np.array(meta['labels'])
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    # Drop the old metadata first, so an interrupted rebuild is never taken as complete
+    if meta_path.exists():
+        meta_path.unlink()
+    decoded = decode_into_file(paths, images_path, size, workers)
+
+    kept_labels = [label for label, ok in zip(labels, decoded) if ok]
+    if not decoded.all():
+        # Compact the failed slots away so row i always matches label i
+        source = np.load(images_path, mmap_mode='r')
+        compact_path = cache_dir / f'.{CACHE_IMAGES_FILE}'
+        compacted = np.lib.format.open_memmap(compact_path, mode='w+', dtype=np.uint8,
+                                              shape=(int(decoded.sum()), size, size, 3))
+        for target, index in enumerate(np.flatnonzero(decoded)):
+            compacted[target] = source[index]
+        compacted.flush()
+        del compacted, source
+        os.replace(compact_path, images_path)
+
+    # Metadata last: it is what marks the cache complete
+    with open(meta_path, 'w') as f:
+        json.dump({'signature': signature, 'size': size, 'labels': kept_labels}, f)
+
+    return np.load(images_path, mmap_mode='r'), np.array(kept_labels)
+
+class SoilImageSequence(keras.utils.Sequence):
+    """Batches of normalized images and one-hot labels read from the uint8 cache
+
+    Only one batch is converted to float32 at a time, so memory stays at the
+    batch size however many images the dataset holds.
+    """
+
+    def __init__(self, images, labels, indices, batch_size=32, shuffle=False, seed=42):
+        super().__init__()
+        self.images = images
+        self.labels = labels
+        self.indices = np.asarray(indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        if shuffle:
+            self.rng.shuffle(self.indices)
+
+    def __len__(self):
+        return math.ceil(len(self.indices) / self.batch_size)
+
+    def __getitem__(self, batch):
+        # Sorted reads walk the memmap forwards
+        batch_indices = np.sort(self.indices[batch * self.batch_size:(batch + 1) * self.batch_size])
+        return preprocess_batch(self.images[batch_indices]), self.labels[batch_indices]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
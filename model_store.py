@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Model Store for Fasal Sathi
+Keeps model arrays as individual uncompressed .npy files so every process
+serving from the same host can memory-map them and share the page cache,
+and publishes trained model sets as versioned directories behind an atomic
+"current" pointer
+"""
+
+import numpy as np
+import json
+import os
+import hashlib
+import shutil
+import tempfile
+from datetime import datetime
+
+STORE_META_FILE = 'meta.json'
+
+# <root>/versions/<version>/ holds one complete model set with its manifest;
+# <root>/current.json names the version predictors should load
+VERSIONS_DIR = 'versions'
+MANIFEST_FILE = 'manifest.json'
+CURRENT_POINTER_FILE = 'current.json'
+
+# Published versions kept on disk after a new one is saved, the current one included
+DEFAULT_KEEP_VERSIONS = 5
+
+def save_arrays(arrays, directory, meta=None):
+    """Write each array to <directory>/<name>.npy
+
+    meta.json is written last and lists the arrays, so a reader that sees it
+    also sees a complete store.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+    manifest = {
+        'arrays': {
+            name: {'dtype': str(array.dtype), 'shape': list(array.shape)}
+            for name, array in arrays.items()
+        },
+        'meta': meta or {}
+    }
+    with open(os.path.join(directory, STORE_META_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def load_arrays(directory, mmap_mode='r'):
+    """Load every array listed in meta.json, memory-mapped by default"""
+    with open(os.path.join(directory, STORE_META_FILE)) as f:
+        manifest = json.load(f)
+
+    return {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        for name in manifest['arrays']
+    }
+
+def write_json_atomic(path, data):
+    """Write JSON next to path and rename it into place
+
+    os.replace is atomic on POSIX, so readers see either the old file or the
+    complete new one, never a partial write.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+def read_json(path):
+    """Parsed JSON file, or None when it does not exist"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_version_dir(root):
+    """Create an empty directory for a new model set, named by timestamp"""
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    directory = os.path.join(root, VERSIONS_DIR, version)
+    os.makedirs(directory)
+    return version, directory
+
+def write_manifest(directory, version, meta=None):
+    """Record the size and checksum of every file in a version directory"""
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and name != MANIFEST_FILE:
+            files[name] = {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+
+    write_json_atomic(os.path.join(directory, MANIFEST_FILE), {
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'files': files,
+        'meta': meta or {}
+    })
+
+def publish_version(root, version):
+    """Point current.json at a fully written version directory"""
+    write_json_atomic(os.path.join(root, CURRENT_POINTER_FILE), {
+        'version': version,
+        'path': f'{VERSIONS_DIR}/{version}',
+        'published_at': datetime.now().isoformat()
+    })
+
+def read_current_version(root):
+    """(version, directory) named by current.json, or (None, None) without one"""
+    pointer = read_json(os.path.join(root, CURRENT_POINTER_FILE))
+    if pointer is None:
+        return None, None
+    return pointer['version'], os.path.join(root, pointer['path'])
+
+def prune_versions(root, keep=DEFAULT_KEEP_VERSIONS):
+    """Delete all but the newest `keep` version directories
+
+    The version current.json points to is never deleted, even when newer
+    unpublished ones exist. Processes still serving a deleted version keep
+    working from their open and memory-mapped files. Returns the removed
+    versions.
+    """
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+
+    current, _ = read_current_version(root)
+    # Timestamp names sort chronologically
+    versions = sorted(name for name in os.listdir(versions_dir)
+                      if os.path.isdir(os.path.join(versions_dir, name)))
+    kept = set(versions[-keep:]) if keep > 0 else set()
+    kept.add(current)
+
+    removed = [version for version in versions if version not in kept]
+    for version in removed:
+        shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+    return removed
+
+def process_memory():
+    """Resident and proportional set size of this process in KB (Linux only)
+
+    PSS splits shared pages between the processes mapping them, so summing it
+    across workers gives the real footprint where summing RSS double counts.
+    Without /proc (macOS, Windows) the result is empty; callers only use it
+    for diagnostics.
+    """
+    memory = {}
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_kb'] = int(line.split()[1])
+    except OSError:
+        return {}
+
+    # smaps_rollup needs Linux 4.14+
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    memory['pss_kb'] = int(line.split()[1])
+    except OSError:
+        pass
+
+    return memory
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Weather Cache for Fasal Sathi
+Caches decoded weather per grid cell so nearby farms share one fetch, with a
+separate time-to-live for current, hourly and daily data, in memory or in a
+SQLite store shared by every process on the host
+"""
+
+import numpy as np
+import csv
+import json
+import sys
+import time
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# Open-Meteo's forecast models resolve roughly 0.1° (~11 km), so points
+# inside one cell get the same forecast anyway
+DEFAULT_GRID_DEGREES = 0.1
+
+# Variable groups of a forecast response, each cached and refreshed on its own
+WEATHER_GROUPS = ['current', 'hourly', 'daily']
+
+# Seconds each group stays fresh: current conditions change fastest, the
+# daily summary slowest
+DEFAULT_GROUP_TTL = {'current': 15 * 60, 'hourly': 60 * 60, 'daily': 6 * 60 * 60}
+
+# Seconds past its TTL an expired group may still be served while a refresh
+# is pending or the API is unreachable; the store keeps groups this long
+DEFAULT_MAX_STALE = 24 * 60 * 60
+
+# Replaces the requests_cache .cache.sqlite, which stored raw HTTP responses
+DEFAULT_STORE_PATH = '.weather_store.sqlite'
+
+class WeatherGridCache:
+    """Thread-safe LRU cache of decoded weather keyed by grid cell
+
+    Each cell holds the current dict and the hourly and daily columns, with
+    the time every group was fetched, so an expired group can be refetched
+    without the others. A grid_degrees of 0 keys on exact coordinates.
+    The clock is injectable so request logs can be replayed at their own pace.
+    """
+
+    def __init__(self, grid_degrees=DEFAULT_GRID_DEGREES, ttl=None, max_cells=10000, clock=time.time):
+        self.grid_degrees = grid_degrees
+        self.ttl = dict(DEFAULT_GROUP_TTL, **(ttl or {}))
+        self.max_cells = max_cells
+        self.clock = clock
+
+        self.cells = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.group_fetches = {group: 0 for group in WEATHER_GROUPS}
+
+    def cell_key(self, latitude, longitude):
+        if not self.grid_degrees:
+            return (latitude, longitude)
+        return (round(latitude / self.grid_degrees), round(longitude / self.grid_degrees))
+
+    def cell_center(self, key):
+        """Coordinates a cell is fetched for, so every member sees the same data"""
+        if not self.grid_degrees:
+            return key
+        return (round(key[0] * self.grid_degrees, 6), round(key[1] * self.grid_degrees, 6))
+
+    def lookup(self, key):
+        """Fresh groups of a cell and the list of groups that need fetching
+
+        The fresh dict also carries the cell's "coordinates" once any group
+        has been fetched.
+        """
+        now = self.clock()
+
+        with self.lock:
+            cell = self.cells.get(key)
+            fresh = {}
+            missing = []
+            for group in WEATHER_GROUPS:
+                entry = cell.get(group) if cell else None
+                if entry is not None and now - entry[1] < self.ttl[group]:
+                    fresh[group] = entry[0]
+                else:
+                    missing.append(group)
+
+            if cell is not None:
+                self.cells.move_to_end(key)
+                if 'coordinates' in cell:
+                    fresh['coordinates'] = cell['coordinates']
+
+            self.count_lookup(missing)
+
+        return fresh, missing
+
+    def fetched_times(self, key):
+        """When each cached group of a cell was fetched, without counting a lookup"""
+        with self.lock:
+            cell = self.cells.get(key) or {}
+            return {group: cell[group][1] for group in WEATHER_GROUPS if group in cell}
+
+    def stale_groups(self, key, max_stale=DEFAULT_MAX_STALE):
+        """Every cached group of a cell no more than max_stale seconds past its
+        TTL, expired or not, without counting a lookup"""
+        now = self.clock()
+
+        with self.lock:
+            cell = self.cells.get(key) or {}
+            groups = {group: cell[group][0] for group in WEATHER_GROUPS
+                      if group in cell and now - cell[group][1] < self.ttl[group] + max_stale}
+            if groups and 'coordinates' in cell:
+                groups['coordinates'] = cell['coordinates']
+        return groups
+
+    def count_lookup(self, missing):
+        if not missing:
+            self.hits += 1
+        elif len(missing) < len(WEATHER_GROUPS):
+            self.partial_hits += 1
+        else:
+            self.misses += 1
+
+    def store(self, key, groups):
+        """Store freshly fetched groups (and coordinates) for a cell"""
+        now = self.clock()
+
+        with self.lock:
+            cell = self.cells.setdefault(key, {})
+            for group, data in groups.items():
+                if group == 'coordinates':
+                    cell[group] = data
+                else:
+                    cell[group] = (data, now)
+                    self.group_fetches[group] += 1
+            self.cells.move_to_end(key)
+
+            while len(self.cells) > self.max_cells:
+                self.cells.popitem(last=False)
+                self.evictions += 1
+
+    def store_many(self, items):
+        """Store (key, groups) pairs"""
+        for key, groups in items:
+            self.store(key, groups)
+
+    def clear(self):
+        with self.lock:
+            self.cells.clear()
+
+    def cell_count(self):
+        return len(self.cells)
+
+    def stats(self):
+        cells = self.cell_count()
+        with self.lock:
+            requests = self.hits + self.partial_hits + self.misses
+            return {
+                "cells": cells,
+                "requests": requests,
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+                "group_fetches": dict(self.group_fetches)
+            }
+
+class WeatherStore(WeatherGridCache):
+    """WeatherGridCache persisted in SQLite, shared across processes
+
+    Groups are stored already decoded: the current dict and coordinates as
+    JSON, hourly and daily columns as packed arrays that load with
+    np.frombuffer, so a hit costs neither an HTTP call nor flatbuffer
+    decoding. WAL mode lets any number of readers run alongside the single
+    writer; each thread gets its own connection.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, grid_degrees=DEFAULT_GRID_DEGREES, ttl=None, clock=time.time):
+        super().__init__(grid_degrees, ttl, max_cells=None, clock=clock)
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS weather_groups (
+                    cell TEXT NOT NULL,
+                    weather_group TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    payload BLOB NOT NULL,
+                    PRIMARY KEY (cell, weather_group)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS weather_groups_fetched_at ON weather_groups (fetched_at)")
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL with synchronous=NORMAL stays consistent; a crash only loses
+            # the last refreshes, which are refetched anyway
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def cell_name(self, key):
+        return f'{key[0]},{key[1]}'
+
+    def lookup(self, key):
+        now = self.clock()
+        rows = self.connection().execute(
+            "SELECT weather_group, fetched_at, payload FROM weather_groups WHERE cell = ?",
+            (self.cell_name(key),)
+        ).fetchall()
+        stored = {group: (fetched_at, payload) for group, fetched_at, payload in rows}
+
+        fresh = {}
+        missing = []
+        for group in WEATHER_GROUPS:
+            entry = stored.get(group)
+            if entry is not None and now - entry[0] < self.ttl[group]:
+                fresh[group] = unpack_group(group, entry[1])
+            else:
+                missing.append(group)
+
+        if 'coordinates' in stored:
+            fresh['coordinates'] = unpack_group('coordinates', stored['coordinates'][1])
+
+        with self.lock:
+            self.count_lookup(missing)
+        return fresh, missing
+
+    def fetched_times(self, key):
+        rows = self.connection().execute(
+            "SELECT weather_group, fetched_at FROM weather_groups WHERE cell = ? AND weather_group != 'coordinates'",
+            (self.cell_name(key),)
+        ).fetchall()
+        return dict(rows)
+
+    def stale_groups(self, key, max_stale=DEFAULT_MAX_STALE):
+        now = self.clock()
+        rows = self.connection().execute(
+            "SELECT weather_group, fetched_at, payload FROM weather_groups WHERE cell = ?",
+            (self.cell_name(key),)
+        ).fetchall()
+
+        stored = {group: (fetched_at, payload) for group, fetched_at, payload in rows}
+
+        groups = {group: unpack_group(group, stored[group][1]) for group in WEATHER_GROUPS
+                  if group in stored and now - stored[group][0] < self.ttl[group] + max_stale}
+        if groups and 'coordinates' in stored:
+            groups['coordinates'] = unpack_group('coordinates', stored['coordinates'][1])
+        return groups
+
+    def store(self, key, groups):
+        self.store_many([(key, groups)])
+
+    def store_many(self, items):
+        """Bulk upsert of (key, groups) pairs in one transaction"""
+        now = self.clock()
+        rows = [
+            (self.cell_name(key), group, now, pack_group(group, data))
+            for key, groups in items for group, data in groups.items()
+        ]
+
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO weather_groups (cell, weather_group, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+        with self.lock:
+            for _, groups in items:
+                for group in groups:
+                    if group in self.group_fetches:
+                        self.group_fetches[group] += 1
+
+    def sweep_expired(self, retain=DEFAULT_MAX_STALE):
+        """Delete groups that expired more than retain seconds ago
+
+        The default keeps everything that may still be served stale.
+        Coordinates never expire on their own; they go with the cell's last
+        group. Returns the number of rows deleted.
+        """
+        now = self.clock()
+        with self.connection() as connection:
+            deleted = 0
+            for group, ttl in self.ttl.items():
+                deleted += connection.execute(
+                    "DELETE FROM weather_groups WHERE weather_group = ? AND fetched_at < ?",
+                    (group, now - ttl - retain)
+                ).rowcount
+            deleted += connection.execute("""
+                DELETE FROM weather_groups WHERE weather_group = 'coordinates' AND cell NOT IN (
+                    SELECT cell FROM weather_groups WHERE weather_group != 'coordinates'
+                )
+            """).rowcount
+        return deleted
+
+    def clear(self):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM weather_groups")
+
+    def cell_count(self):
+        return self.connection().execute("SELECT COUNT(DISTINCT cell) FROM weather_groups").fetchone()[0]
+
+def pack_group(group, data):
+    """Serialize a decoded group: JSON for dicts, packed arrays for columns"""
+    if group in ('hourly', 'daily'):
+        return pack_columns(data)
+    return json.dumps(data).encode('utf-8')
+
+def unpack_group(group, payload):
+    if group in ('hourly', 'daily'):
+        return unpack_columns(payload)
+    return json.loads(payload)
+
+def pack_columns(columns):
+    """Columns as one blob: a length-prefixed JSON header, then the raw arrays"""
+    header = {}
+    offset = 0
+    for key, values in columns.items():
+        values = np.ascontiguousarray(values)
+        header[key] = [values.dtype.str, len(values), offset]
+        offset += values.nbytes
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    parts = [struct.pack('<I', len(header_bytes)), header_bytes]
+    parts.extend(np.ascontiguousarray(values).tobytes() for values in columns.values())
+    return b''.join(parts)
+
+def unpack_columns(payload):
+    """Read-only array views into a pack_columns blob"""
+    header_length = struct.unpack_from('<I', payload)[0]
+    header = json.loads(payload[4:4 + header_length])
+    start = 4 + header_length
+    return {
+        key: np.frombuffer(payload, dtype=dtype, count=count, offset=start + offset)
+        for key, (dtype, count, offset) in header.items()
+    }
+
+def load_request_log(path):
+    """(timestamp, latitude, longitude) records from a CSV request log
+
+    The log needs timestamp, latitude and longitude columns; timestamps are
+    unix seconds or ISO 8601. Records are returned in time order.
+    """
+    records = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            stamp = row['timestamp']
+            try:
+                timestamp = float(stamp)
+            except ValueError:
+                timestamp = datetime.fromisoformat(stamp).timestamp()
+            records.append((timestamp, float(row['latitude']), float(row['longitude'])))
+
+    records.sort(key=lambda record: record[0])
+    return records
+
+def replay_request_log(records, grid_degrees=DEFAULT_GRID_DEGREES, ttl=None):
+    """Cache statistics for a request log, without calling the API
+
+    Every miss is treated as an immediate fetch of the missing groups.
+    """
+    now = [0.0]
+    cache = WeatherGridCache(grid_degrees, ttl, max_cells=len(records) + 1, clock=lambda: now[0])
+
+    for timestamp, latitude, longitude in records:
+        now[0] = timestamp
+        key = cache.cell_key(latitude, longitude)
+        _, missing = cache.lookup(key)
+        if missing:
+            cache.store(key, {group: None for group in missing})
+
+    return cache.stats()
+
+if __name__ == "__main__":
+    # sweep [store_path] drops groups too old to serve even stale from the shared store
+    if len(sys.argv) in (2, 3) and sys.argv[1] == "sweep":
+        store = WeatherStore(sys.argv[2] if len(sys.argv) == 3 else DEFAULT_STORE_PATH)
+        print(json.dumps({"deleted": store.sweep_expired(), "cells": store.cell_count()}))
+        sys.exit(0)
+    
+    if len(sys.argv) < 3 or sys.argv[1] != "replay":
+        print("Usage: python weather_cache.py replay <request_log.csv> [grid_degrees]")
+        print("       python weather_cache.py sweep [store_path]")
+        sys.exit(1)
+
+    records = load_request_log(sys.argv[2])
+    grid_degrees = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_GRID_DEGREES
+
+    # Exact coordinates is what a URL-keyed HTTP cache sees
+    print(json.dumps({
+        "grid": dict(replay_request_log(records, grid_degrees), grid_degrees=grid_degrees),
+        "exact_coordinates": replay_request_log(records, 0)
+    }, indent=2))
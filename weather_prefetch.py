@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Weather Prefetch Scheduler for Fasal Sathi
+Keeps the weather of registered farm locations fresh in the shared store, so
+user-facing calls hit a warm cache instead of waiting on the API
+"""
+
+import csv
+import heapq
+import json
+import random
+import sys
+import time
+import threading
+
+from weather_cache import WeatherStore, WEATHER_GROUPS, DEFAULT_STORE_PATH
+from weather_service import WeatherService, DEFAULT_LOCATION_BATCH_SIZE
+
+# Open-Meteo's free tier allows 600 calls a minute and counts every location
+# of a multi-location request; stay well below it by default
+DEFAULT_LOCATIONS_PER_MINUTE = 300
+
+# Refresh a group once this fraction of its TTL is left, so it is renewed
+# before users see it expire
+DEFAULT_REFRESH_MARGIN = 0.2
+
+# Spread of the scheduled refresh time, as a fraction of the refresh margin,
+# so cells loaded together do not all come due in the same second
+DEFAULT_JITTER = 0.5
+
+# Seconds before retrying cells whose refresh failed
+RETRY_DELAY = 60
+
+class TokenBucket:
+    """Blocking token bucket: rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def acquire(self, tokens=1):
+        """Wait until tokens are available and take them"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            self.sleep((tokens - self.tokens) / self.rate)
+
+def load_farm_locations(paths):
+    """(latitude, longitude) of every row with coordinates in SHC-style CSVs"""
+    locations = []
+    for path in paths:
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    locations.append((float(row['latitude']), float(row['longitude'])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    return locations
+
+class WeatherPrefetcher:
+    """Refresh the weather of registered locations ahead of expiry
+
+    Locations are reduced to the cache's grid cells and kept in a heap
+    ordered by when their first group comes due. Due cells needing the same
+    groups are fetched together, batch_size per request, through a token
+    bucket counting locations. Cells refreshed meanwhile by a user request
+    are simply rescheduled.
+    """
+
+    def __init__(self, weather_service, locations, batch_size=DEFAULT_LOCATION_BATCH_SIZE,
+                 locations_per_minute=DEFAULT_LOCATIONS_PER_MINUTE, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 jitter=DEFAULT_JITTER, clock=time.time, seed=None):
+        self.weather_service = weather_service
+        self.cache = weather_service.cache
+        self.batch_size = batch_size
+        self.refresh_margin = refresh_margin
+        self.jitter = jitter
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.rate_limiter = TokenBucket(locations_per_minute / 60.0, capacity=batch_size)
+
+        self.cells = list(dict.fromkeys(self.cache.cell_key(latitude, longitude)
+                                        for latitude, longitude in locations))
+        self.schedule = []
+        now = self.clock()
+        for key in self.cells:
+            heapq.heappush(self.schedule, (self.next_due(key, now), key))
+
+        self.stats = {"cells": len(self.cells), "refreshed": 0, "requests": 0, "failures": 0}
+        self.stop_event = threading.Event()
+
+    def lead_time(self, group):
+        return self.cache.ttl[group] * self.refresh_margin
+
+    def due_groups(self, key, now):
+        """Groups of a cell that are missing or inside their refresh margin"""
+        fetched = self.cache.fetched_times(key)
+        return [group for group in WEATHER_GROUPS
+                if group not in fetched or fetched[group] + self.cache.ttl[group] - self.lead_time(group) <= now]
+
+    def next_due(self, key, now):
+        """When the cell's first group enters its refresh margin, with jitter"""
+        fetched = self.cache.fetched_times(key)
+        due = now
+        if len(fetched) == len(WEATHER_GROUPS):
+            due = min(fetched[group] + self.cache.ttl[group] - self.lead_time(group) for group in WEATHER_GROUPS)
+            spread = min(self.lead_time(group) for group in WEATHER_GROUPS) * self.jitter
+            due += self.random.uniform(-spread, 0)
+        return max(due, now)
+
+    def refresh_due(self):
+        """Refresh every cell that is due now; returns the number refreshed
+
+        Stops between batches once stop() is called, putting the cells not
+        yet fetched back on the schedule as due.
+        """
+        now = self.clock()
+
+        pending = {}
+        while self.schedule and self.schedule[0][0] <= now:
+            _, key = heapq.heappop(self.schedule)
+            groups = self.due_groups(key, now)
+            if groups:
+                pending.setdefault(tuple(groups), []).append(key)
+            else:
+                # Refreshed by someone else since it was scheduled
+                heapq.heappush(self.schedule, (self.next_due(key, now), key))
+
+        batches = [(groups, cells[i:i + self.batch_size]) for groups, cells in pending.items()
+                   for i in range(0, len(cells), self.batch_size)]
+
+        refreshed = 0
+        for number, (groups, batch) in enumerate(batches):
+            if self.stop_event.is_set():
+                for _, unfetched in batches[number:]:
+                    for key in unfetched:
+                        heapq.heappush(self.schedule, (now, key))
+                break
+
+            self.rate_limiter.acquire(len(batch))
+            results = self.weather_service.fetch_cells(batch, list(groups))
+            self.stats["requests"] += 1
+
+            done = self.clock()
+            for key, (_, error) in zip(batch, results):
+                if error is None:
+                    refreshed += 1
+                    heapq.heappush(self.schedule, (self.next_due(key, done), key))
+                else:
+                    self.stats["failures"] += 1
+                    heapq.heappush(self.schedule, (done + RETRY_DELAY, key))
+
+        self.stats["refreshed"] += refreshed
+        return refreshed
+
+    def seconds_until_due(self):
+        if not self.schedule:
+            return None
+        return max(0.0, self.schedule[0][0] - self.clock())
+
+    def run(self, max_sleep=60):
+        """Refresh due cells until stop() is called"""
+        while not self.stop_event.is_set():
+            self.refresh_due()
+            wait = self.seconds_until_due()
+            self.stop_event.wait(max_sleep if wait is None else min(wait, max_sleep))
+
+    def start(self, max_sleep=60):
+        """Run the scheduler on a daemon thread"""
+        thread = threading.Thread(target=self.run, args=(max_sleep,), name='weather-prefetch', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+if __name__ == "__main__":
+    # weather_prefetch.py <shc.csv> [<shc.csv> ...] [--store PATH] [--rate N] [--once]
+    args = sys.argv[1:]
+    once = '--once' in args
+    if once:
+        args.remove('--once')
+
+    store_path = DEFAULT_STORE_PATH
+    locations_per_minute = DEFAULT_LOCATIONS_PER_MINUTE
+    paths = []
+    i = 0
+    while i < len(args):
+        if args[i] == '--store' and i + 1 < len(args):
+            store_path = args[i + 1]
+            i += 2
+        elif args[i] == '--rate' and i + 1 < len(args):
+            try:
+                locations_per_minute = float(args[i + 1])
+            except ValueError:
+                locations_per_minute = 0
+            i += 2
+        else:
+            paths.append(args[i])
+            i += 1
+
+    # A rate must be positive: zero would never refill the token bucket
+    if not paths or not locations_per_minute > 0:
+        print("Usage: python weather_prefetch.py <shc.csv> [<shc.csv> ...] [--store PATH] [--rate N] [--once]")
+        sys.exit(1)
+
+    weather_service = WeatherService(cache=WeatherStore(store_path))
+    prefetcher = WeatherPrefetcher(weather_service, load_farm_locations(paths),
+                                   locations_per_minute=locations_per_minute)
+    print(f"🌦️ Prefetching weather for {len(prefetcher.cells)} grid cells")
+
+    if once:
+        prefetcher.refresh_due()
+        print(json.dumps(prefetcher.stats))
+    else:
+        try:
+            prefetcher.run()
+        except KeyboardInterrupt:
+            print(f"\n🛑 Prefetch stopped: {json.dumps(prefetcher.stats)}")